@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compares IPA metadata extraction through the zip central directory with the `ipa.IPAFile` based path.
+
+Usage: python benchmarks/ipa_metadata.py [--sizes=1,2,3,4] [--dir=/tmp] [--repeat=5] [--keep]
+
+Test archives of given sizes (in GiB) are generated with Info.plist stored as the last entry, which is the worst case
+for scanning readers. Times are measured with warm page cache.
+"""
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import os
+import sys
+import time
+import zipfile
+import plistlib
+
+from tornado.options import define, options, parse_command_line
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "sharedown"))
+
+from utils.metadata import Metadata
+
+try:
+    from ipa import IPAFile
+except ImportError:
+    IPAFile = None
+
+define("sizes", type=str, default="1,2,3,4", help="Comma separated archive sizes in GiB")
+define("dir", type=str, default="/tmp", help="Directory for generated archives")
+define("repeat", type=int, default=5, help="Number of runs per archive")
+define("keep", type=bool, default=False, help="Keep generated archives")
+
+_CHUNK_SIZE = 1024 ** 2
+_INFO_PLIST = {
+    "CFBundleIdentifier": "com.example.benchmark",
+    "CFBundleDisplayName": "Benchmark",
+    "CFBundleShortVersionString": "1.0",
+    "CFBundleVersion": "1",
+    "UIDeviceFamily": [1, 2],
+}
+
+
+def generate(path, size):
+    chunk = os.urandom(_CHUNK_SIZE)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for i in range(int(size // _CHUNK_SIZE)):
+            archive.writestr("Payload/Benchmark.app/Assets/%06d.bin" % i, chunk)
+        archive.writestr("Payload/Benchmark.app/Info.plist", plistlib.writePlistToString(_INFO_PLIST))
+
+
+def measure(func, path):
+    times = []
+    for _ in range(options.repeat):
+        start = time.time()
+        func(path)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def ipa_file(path):
+    with IPAFile(path) as ipa:
+        return ipa.get_device_family(), ipa.get_app_name(), ipa.get_app_version(), ipa.app_info["CFBundleIdentifier"]
+
+
+def main():
+    parse_command_line()
+
+    print("%8s %14s %14s" % ("GiB", "zip directory", "ipa.IPAFile"))
+    for size in options.sizes.split(","):
+        path = os.path.join(options.dir, "benchmark-%s.ipa" % size)
+        if not os.path.exists(path):
+            generate(path, float(size) * 1024 ** 3)
+
+        try:
+            assert Metadata(path)[Metadata.BUNDLE_ID] == _INFO_PLIST["CFBundleIdentifier"]
+            fast = "%.2f ms" % (measure(Metadata, path) * 1000)
+            slow = "%.2f ms" % (measure(ipa_file, path) * 1000) if IPAFile else "n/a"
+            print("%8s %14s %14s" % (size, fast, slow))
+        finally:
+            if not options.keep:
+                os.remove(path)
+
+if __name__ == "__main__":
+    main()
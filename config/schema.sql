@@ -15,6 +15,23 @@
 /*!40101 SET @OLD_SQL_MODE=@@SQL_MODE, SQL_MODE='NO_AUTO_VALUE_ON_ZERO' */;
 /*!40111 SET @OLD_SQL_NOTES=@@SQL_NOTES, SQL_NOTES=0 */;
 
+--
+-- Table structure for table `blobs`
+--
+
+DROP TABLE IF EXISTS `blobs`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `blobs` (
+  `sha256` char(64) CHARACTER SET ascii NOT NULL,
+  `object` varchar(300) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `size` bigint(20) unsigned NOT NULL,
+  `refs` int(10) unsigned NOT NULL DEFAULT '0',
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`sha256`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `feeds`
 --
@@ -28,6 +45,7 @@ CREATE TABLE `feeds` (
   `title` varchar(64) COLLATE utf8_bin DEFAULT NULL,
   `readme` text COLLATE utf8_bin,
   `is_enabled` tinyint(1) NOT NULL DEFAULT '1',
+  `version` int(10) unsigned NOT NULL DEFAULT '0',
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`login`),
   CONSTRAINT `feeds_ibfk_1` FOREIGN KEY (`login`) REFERENCES `users` (`login`) ON DELETE CASCADE ON UPDATE CASCADE
@@ -50,10 +68,16 @@ CREATE TABLE `files` (
   `caption` varchar(64) COLLATE utf8_bin DEFAULT NULL,
   `password` varbinary(72) DEFAULT NULL,
   `is_public` tinyint(1) NOT NULL DEFAULT '0',
+  `has_icon` tinyint(1) NOT NULL DEFAULT '0',
+  `sha256` char(64) CHARACTER SET ascii DEFAULT NULL,
+  `downloads` int(10) unsigned NOT NULL DEFAULT '0',
   `expires_at` datetime DEFAULT NULL,
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`key`),
-  KEY `login` (`login`)
+  KEY `login` (`login`),
+  KEY `expires_at` (`expires_at`),
+  KEY `login_name` (`login`,`name`,`created_at`),
+  KEY `sha256` (`sha256`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
 /*!40101 SET character_set_client = @saved_cs_client */;
 /*!50003 SET @saved_cs_client      = @@character_set_client */ ;
@@ -65,6 +89,17 @@ CREATE TABLE `files` (
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = '' */ ;
 DELIMITER ;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ /*!50003 TRIGGER `feed_insert` AFTER INSERT ON `files`
+ FOR EACH ROW UPDATE feeds SET version = version + 1 WHERE login = NEW.login */;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ /*!50003 TRIGGER `feed_update` AFTER UPDATE ON `files`
+ FOR EACH ROW BEGIN
+  IF NOT (OLD.login <=> NEW.login AND OLD.name <=> NEW.name AND OLD.size <=> NEW.size AND OLD.folder <=> NEW.folder
+      AND OLD.caption <=> NEW.caption AND OLD.is_public <=> NEW.is_public AND OLD.expires_at <=> NEW.expires_at) THEN
+    UPDATE feeds SET version = version + 1 WHERE login IN (OLD.login, NEW.login);
+  END IF;
+ END */;;
+/*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ /*!50003 TRIGGER `feed_delete` BEFORE DELETE ON `files`
+ FOR EACH ROW UPDATE feeds SET version = version + 1 WHERE login = OLD.login */;;
 /*!50003 CREATE*/ /*!50017 DEFINER=`root`@`localhost`*/ /*!50003 TRIGGER `stats` AFTER DELETE ON `files`
  FOR EACH ROW UPDATE stats SET deleted_at = NOW() WHERE `key` = OLD.key AND deleted_at IS NULL */;;
 DELIMITER ;
@@ -73,6 +108,35 @@ DELIMITER ;
 /*!50003 SET character_set_results = @saved_cs_results */ ;
 /*!50003 SET collation_connection  = @saved_col_connection */ ;
 
+--
+-- Table structure for table `jobs`
+--
+
+DROP TABLE IF EXISTS `jobs`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `jobs` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `type` varchar(32) CHARACTER SET ascii NOT NULL,
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `login` varchar(32) CHARACTER SET ascii DEFAULT NULL,
+  `payload` mediumtext COLLATE utf8_bin,
+  `result` mediumtext COLLATE utf8_bin,
+  `error` varchar(255) COLLATE utf8_bin DEFAULT NULL,
+  `status` enum('PENDING','RUNNING','DONE','FAILED') CHARACTER SET ascii NOT NULL DEFAULT 'PENDING',
+  `attempts` tinyint(3) unsigned NOT NULL DEFAULT '0',
+  `lease` char(16) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `leased_until` datetime DEFAULT NULL,
+  `run_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `status` (`status`,`run_at`),
+  KEY `lease` (`lease`),
+  KEY `key` (`key`,`type`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `meta`
 --
@@ -89,6 +153,22 @@ CREATE TABLE `meta` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `search`
+--
+
+DROP TABLE IF EXISTS `search`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `search` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `content` text COLLATE utf8_general_ci NOT NULL,
+  PRIMARY KEY (`key`),
+  FULLTEXT KEY `content` (`content`),
+  CONSTRAINT `search_ibfk_1` FOREIGN KEY (`key`) REFERENCES `files` (`key`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `sess`
 --
@@ -141,6 +221,50 @@ CREATE TABLE `stats` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `upload_parts`
+--
+
+DROP TABLE IF EXISTS `upload_parts`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `upload_parts` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `number` smallint(5) unsigned NOT NULL,
+  `size` int(10) unsigned NOT NULL,
+  `etag` varchar(64) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  PRIMARY KEY (`key`,`number`),
+  CONSTRAINT `upload_parts_ibfk_1` FOREIGN KEY (`key`) REFERENCES `uploads` (`key`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `uploads`
+--
+
+DROP TABLE IF EXISTS `uploads`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `uploads` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `login` varchar(32) CHARACTER SET ascii DEFAULT NULL,
+  `name` varchar(255) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `size` bigint(20) unsigned NOT NULL,
+  `part_size` int(10) unsigned NOT NULL,
+  `mode` enum('PROXY','DIRECT','POST') CHARACTER SET ascii NOT NULL DEFAULT 'PROXY',
+  `upload_id` varchar(255) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `folder` varchar(64) CHARACTER SET utf8 DEFAULT NULL,
+  `caption` varchar(64) COLLATE utf8_bin DEFAULT NULL,
+  `password` varbinary(72) DEFAULT NULL,
+  `is_public` tinyint(1) NOT NULL DEFAULT '0',
+  `expires_at` datetime DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`key`),
+  KEY `updated_at` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `users`
 --
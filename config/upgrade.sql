@@ -0,0 +1,109 @@
+--
+-- Schema changes for existing installations, apply in order
+--
+
+-- Materialized download counters (backfill with `sharedown.py --rebuild_counters`)
+ALTER TABLE `files` ADD COLUMN `downloads` int(10) unsigned NOT NULL DEFAULT '0' AFTER `is_public`;
+
+-- Index for expiry scheduling and sweeping
+ALTER TABLE `files` ADD KEY `expires_at` (`expires_at`);
+
+-- Full-text search index, requires MySQL 5.6+ (backfill with `sharedown.py --rebuild_search`)
+CREATE TABLE `search` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `content` text COLLATE utf8_general_ci NOT NULL,
+  PRIMARY KEY (`key`),
+  FULLTEXT KEY `content` (`content`),
+  CONSTRAINT `search_ibfk_1` FOREIGN KEY (`key`) REFERENCES `files` (`key`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+
+-- Index for keyset pagination of file listings
+ALTER TABLE `files` ADD KEY `login_name` (`login`,`name`,`created_at`);
+
+-- Resumable uploads
+CREATE TABLE `uploads` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `login` varchar(32) CHARACTER SET ascii DEFAULT NULL,
+  `name` varchar(255) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `size` bigint(20) unsigned NOT NULL,
+  `part_size` int(10) unsigned NOT NULL,
+  `upload_id` varchar(255) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `folder` varchar(64) CHARACTER SET utf8 DEFAULT NULL,
+  `caption` varchar(64) COLLATE utf8_bin DEFAULT NULL,
+  `password` varbinary(72) DEFAULT NULL,
+  `is_public` tinyint(1) NOT NULL DEFAULT '0',
+  `expires_at` datetime DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`key`),
+  KEY `updated_at` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+
+CREATE TABLE `upload_parts` (
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `number` smallint(5) unsigned NOT NULL,
+  `size` int(10) unsigned NOT NULL,
+  `etag` varchar(64) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  PRIMARY KEY (`key`,`number`),
+  CONSTRAINT `upload_parts_ibfk_1` FOREIGN KEY (`key`) REFERENCES `uploads` (`key`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+
+-- Direct uploads to S3
+ALTER TABLE `uploads` ADD COLUMN `mode` enum('PROXY','DIRECT','POST') CHARACTER SET ascii NOT NULL DEFAULT 'PROXY' AFTER `part_size`;
+
+-- Background jobs
+CREATE TABLE `jobs` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `type` varchar(32) CHARACTER SET ascii NOT NULL,
+  `key` char(8) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `login` varchar(32) CHARACTER SET ascii DEFAULT NULL,
+  `payload` text COLLATE utf8_bin,
+  `result` text COLLATE utf8_bin,
+  `error` varchar(255) COLLATE utf8_bin DEFAULT NULL,
+  `status` enum('PENDING','RUNNING','DONE','FAILED') CHARACTER SET ascii NOT NULL DEFAULT 'PENDING',
+  `attempts` tinyint(3) unsigned NOT NULL DEFAULT '0',
+  `lease` char(16) CHARACTER SET ascii COLLATE ascii_bin DEFAULT NULL,
+  `leased_until` datetime DEFAULT NULL,
+  `run_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `status` (`status`,`run_at`),
+  KEY `lease` (`lease`),
+  KEY `key` (`key`,`type`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+
+-- Application icons
+ALTER TABLE `files` ADD COLUMN `has_icon` tinyint(1) NOT NULL DEFAULT '0' AFTER `is_public`;
+
+-- Content deduplication
+CREATE TABLE `blobs` (
+  `sha256` char(64) CHARACTER SET ascii NOT NULL,
+  `object` varchar(300) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  `size` bigint(20) unsigned NOT NULL,
+  `refs` int(10) unsigned NOT NULL DEFAULT '0',
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`sha256`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COLLATE=utf8_bin;
+
+ALTER TABLE `files` ADD COLUMN `sha256` char(64) CHARACTER SET ascii DEFAULT NULL AFTER `has_icon`, ADD KEY `sha256` (`sha256`);
+
+-- Bulk deletion jobs
+ALTER TABLE `jobs` MODIFY `payload` mediumtext COLLATE utf8_bin, MODIFY `result` mediumtext COLLATE utf8_bin;
+
+-- Feed versions shared by all processes, bumped with changes of files shown in feeds
+ALTER TABLE `feeds` ADD COLUMN `version` int(10) unsigned NOT NULL DEFAULT '0' AFTER `is_enabled`;
+
+DELIMITER ;;
+CREATE TRIGGER `feed_insert` AFTER INSERT ON `files`
+ FOR EACH ROW UPDATE feeds SET version = version + 1 WHERE login = NEW.login;;
+CREATE TRIGGER `feed_update` AFTER UPDATE ON `files`
+ FOR EACH ROW BEGIN
+  IF NOT (OLD.login <=> NEW.login AND OLD.name <=> NEW.name AND OLD.size <=> NEW.size AND OLD.folder <=> NEW.folder
+      AND OLD.caption <=> NEW.caption AND OLD.is_public <=> NEW.is_public AND OLD.expires_at <=> NEW.expires_at) THEN
+    UPDATE feeds SET version = version + 1 WHERE login IN (OLD.login, NEW.login);
+  END IF;
+ END;;
+CREATE TRIGGER `feed_delete` BEFORE DELETE ON `files`
+ FOR EACH ROW UPDATE feeds SET version = version + 1 WHERE login = OLD.login;;
+DELIMITER ;
@@ -26,13 +26,15 @@ import os
 import re
 import utils
 import base64
+import logging
 import functools
 
 from abc import ABCMeta
 from tornado.web import URLSpec, RequestHandler, RedirectHandler, HTTPError
 from tornado.escape import native_str, json_encode, json_decode
 from tornado.options import options
-from tornado.gen import coroutine
+from tornado.gen import coroutine, Return
+from utils.executor import PoolSaturatedError
 
 __dir__ = os.path.dirname(__file__)
 __all__ = [py[:-3] for py in os.listdir(__dir__) if py.endswith(".py")]
@@ -94,18 +96,58 @@ class BaseHandler(RequestHandler):
     def thread_pool(self):
         return self.application.thread_pool
 
+    @property
+    def process_pool(self):
+        return self.application.process_pool
+
     @property
     def db(self):
-        """pyDBAL connection instance alias
+        """pyDBAL connection pool alias
 
-        :return: pyDBAL thread-safe connection instance
-        :rtype: pydbal.threading.SafeConnection
+        :return: pyDBAL connection pool instance
+        :rtype: utils.pool.ConnectionPool
         """
         return self.application.database
 
     @property
-    def s3(self):
-        return self.application.s3
+    def stats(self):
+        return self.application.stats
+
+    @property
+    def sessions(self):
+        return self.application.sessions
+
+    @property
+    def feeds(self):
+        return self.application.feeds
+
+    @property
+    def expiry(self):
+        return self.application.expiry
+
+    @property
+    def storage(self):
+        return self.application.storage
+
+    @property
+    def sweeper(self):
+        return self.application.sweeper
+
+    @property
+    def jobs(self):
+        return self.application.jobs
+
+    @property
+    def worker(self):
+        return self.application.worker
+
+    @property
+    def blobs(self):
+        return self.application.blobs
+
+    @property
+    def file_cache(self):
+        return self.application.file_cache
 
     def get_header(self, name, default=RequestHandler._ARG_DEFAULT):
         try:
@@ -141,8 +183,8 @@ class BaseHandler(RequestHandler):
 
     @coroutine
     def prepare(self):
-        # if request contains JSON encoded body
-        if self.get_header("Content-Type", "").startswith("application/json"):
+        # if request contains JSON encoded body (not available yet if the body is streamed)
+        if isinstance(self.request.body, bytes) and self.get_header("Content-Type", "").startswith("application/json"):
             try:
                 json_data = json_decode(self.request.body)
                 for key, value in json_data.items():
@@ -160,16 +202,15 @@ class BaseHandler(RequestHandler):
         if not session:
             return
 
+        # validated on every request (not cached), so that revoked sessions are rejected by all processes at once
         user = yield self.thread_pool.submit(
             self.db.fetch, "SELECT u.*, s.session FROM users u INNER JOIN sess s ON s.login = u.login AND s.session = ?"
             " WHERE u.is_enabled = TRUE AND (s.expires_at IS NULL OR s.expires_at > NOW())", session)
         if not user:
             return
 
-        yield self.thread_pool.submit(
-            self.db.execute, "UPDATE sess SET expires_at = NOW() + INTERVAL %d SECOND WHERE login = ? AND session = ? "
-            "AND expires_at IS NOT NULL" % options.session["lifetime"], user["login"], user["session"])
-
+        # expiry is extended in bulk by the periodic sessions flush
+        self.sessions.touch(session)
         self.current_user = user
 
     def create_session(self, login):
@@ -182,6 +223,21 @@ class BaseHandler(RequestHandler):
     def clear_session(self, login, session):
         self.db.execute("DELETE FROM sess WHERE login = ? AND session = ?", login, session)
 
+    @coroutine
+    def _run_cpu_bound(self, fn, *args):
+        try:
+            result = yield self.process_pool.submit(fn, *args)
+        except PoolSaturatedError:
+            logging.warning("Rejected %s %s: process pool is saturated", self.request.method, self.request.uri)
+            raise HTTPError(503)
+        raise Return(result)
+
+    def hash_password(self, password):
+        return self._run_cpu_bound(utils.hash_password, password)
+
+    def check_password(self, password, hashed):
+        return self._run_cpu_bound(utils.check_password, password, hashed)
+
     def check_level(self, *args):
         if self.current_user and self.current_user["level"] in args:
             return True
@@ -200,13 +256,19 @@ class BaseHandler(RequestHandler):
         finally:
             self.clear_cookie("flash")
 
+    def get_json_callback(self):
+        callback = self.get_argument("callback", None)
+        if callback and all(map(lambda x: BaseHandler._RE_JSON_CALLBACK.match(x), callback.split("."))):
+            return callback
+        return None
+
     def write(self, chunk=None):
         if chunk is None:
             chunk = {"status": "ok"}
         chunk = utils.normalize_chunk(chunk)
         if isinstance(chunk, dict):
-            callback = self.get_argument("callback", None)
-            if callback and all(map(lambda x: BaseHandler._RE_JSON_CALLBACK.match(x), callback.split("."))):
+            callback = self.get_json_callback()
+            if callback:
                 self.set_header("Content-Type", "text/javascript; charset=UTF-8")
                 chunk = "/**/%s(%s);" % (callback, json_encode(chunk))
         super(BaseHandler, self).write(chunk)
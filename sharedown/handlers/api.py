@@ -22,15 +22,18 @@
 
 from __future__ import absolute_import, division, print_function, with_statement
 
-import os
 import re
 import utils
+import hashlib
 import logging
 
-from tornado.gen import coroutine
-from tornado.web import HTTPError, removeslash
+from tornado.gen import coroutine, Return
+from tornado.web import HTTPError, removeslash, stream_request_body
+from tornado.ioloop import IOLoop
+from tornado.options import options
+from tornado.escape import json_encode
 from pydbal.exception import DBALDriverError
-from utils.metadata import Metadata
+from utils import search as search_index
 
 from . import BaseHandler, route, authenticated, check_level
 
@@ -42,6 +45,19 @@ class IndexHandler(BaseHandler):
         self.write({"version": self.application.version})
 
 
+@route(r"/api/stats")
+class StatsHandler(BaseHandler):
+    @check_level(
+        BaseHandler.LEVEL_SUPER,
+        BaseHandler.LEVEL_ADMIN)
+    def get(self):
+        # counters are kept by each process, so they cover requests handled by this one only
+        self.write({
+            "uploads": self.storage.get_stats(),
+            "stats": {"buffered": len(self.stats), "dropped": self.stats.dropped},
+        })
+
+
 @route(r"/api/auth")
 class AuthHandler(BaseHandler):
     @authenticated
@@ -58,7 +74,11 @@ class AuthLoginHandler(BaseHandler):
 
         user = yield self.thread_pool.submit(
             self.db.fetch, "SELECT * FROM users WHERE login = ? AND is_enabled = TRUE", _login)
-        if not user or utils.hash_password(_password, user["password"]) != user["password"]:
+        if not user:
+            raise HTTPError(401)
+
+        is_valid = yield self.check_password(_password, user["password"])
+        if not is_valid:
             raise HTTPError(401)
 
         session = yield self.thread_pool.submit(self.create_session, user["login"])
@@ -76,9 +96,9 @@ class AuthPasswdHandler(BaseHandler):
         if not _password or _login != self.current_user["login"]:
             raise HTTPError(400)
 
+        password = yield self.hash_password(_password)
         yield self.thread_pool.submit(
-            self.db.execute, "UPDATE users SET password = ? WHERE login = ?",
-            utils.hash_password(_password), _login)
+            self.db.execute, "UPDATE users SET password = ? WHERE login = ?", password, _login)
         self.status_ok()
 
 
@@ -92,22 +112,22 @@ class AuthLogoutHandler(BaseHandler):
         self.status_ok()
 
 
-@route(r"/api/upload")
-class UploadHandler(BaseHandler):
-    @coroutine
-    def put(self):
-        _file = self.get_header("X-File")
+class BaseUploadHandler(BaseHandler):
+    MODE_PROXY = "PROXY"
+    MODE_DIRECT = "DIRECT"
+    MODE_POST = "POST"
+
+    @staticmethod
+    def _count_parts(size, part_size):
+        return -(-size // part_size)
+
+    def _get_values(self, size):
         _name = self.get_header("X-SF-Name")
         _public = self.get_header("X-SF-Public", None)
         _folder = self.get_header("X-SF-Folder", None)
         _caption = self.get_header("X-SF-Caption", None)
         _password = self.get_header("X-SF-Password", None)
         _permanent = self.get_header("X-SF-Permanent", None)
-        _content_type = self.get_header("Content-Type", None)
-
-        size = os.stat(_file).st_size
-        if not size:
-            raise HTTPError(411)
 
         name = utils.normalize_filename(_name)
         if not name:
@@ -131,157 +151,492 @@ class UploadHandler(BaseHandler):
             values["is_public"] = _public
 
         if _permanent == "0" or _permanent is None:
-            values["expires_at"] = self.s3.get_expiry_date()
+            values["expires_at"] = self.storage.get_expiry_date()
         elif _permanent != "1":
             expires_at = utils.datetime_parse(_permanent)
             if expires_at is None:
                 raise HTTPError(400)
             values["expires_at"] = expires_at
 
+        return values
+
+    def _get_content_type(self, header="Content-Type"):
+        return utils.normalize_content_type(self.get_header(header, None), self.get_header("X-SF-Name"))
+
+    def _get_object_metadata(self):
+        return {"auth": self.current_user["login"]}
+
+    @coroutine
+    def _insert(self, values):
+        def callback(conn, _key):
+            try:
+                # insert() replaces the values with placeholders
+                conn.insert("files", dict(values, **{"`key`": _key}))
+            except DBALDriverError:
+                # Error: 1062 (ER_DUP_ENTRY)
+                if conn.error_code() != 1062:
+                    raise
+                return False
+            # name and caption are searchable right away, the metadata job adds its values later
+            search_index.reindex(conn, (_key, ))
+            return True
+
         def prepare():
             with self.db.locked() as conn:
                 while True:
-                    try:
-                        values["`key`"] = _key = utils.random_bytes(8)
-                        conn.insert("files", values)
+                    _key = utils.random_bytes(8)
+                    if conn.transaction(lambda _conn: callback(_conn, _key)):
                         return _key
-                    except DBALDriverError:
-                        # Error: 1062 (ER_DUP_ENTRY)
-                        if conn.error_code() != 1062:
-                            raise
 
         key = yield self.thread_pool.submit(prepare)
+        self.expiry.schedule(key, values.get("expires_at"))
+        raise Return(key)
 
+    def _get_sha256(self):
+        _sha256 = self.get_header("X-SF-SHA256", None)
+        if _sha256 is not None and not re.match(r"^[0-9a-fA-F]{64}$", _sha256):
+            raise HTTPError(400)
+        return _sha256 and _sha256.lower()
+
+    @coroutine
+    def _insert_deduplicated(self, values, sha256, login=None):
+        """Creates a file referring to the stored content instead of uploading it again.
+
+        :return: file key, or None if the content has not been stored before (by the user, if `login` is given)
+        """
+        blob = yield self.thread_pool.submit(self.blobs.find, sha256, login)
+        if not blob or blob["size"] != values["size"]:
+            raise Return(None)
+
+        key = yield self._insert(values)
+        object_key = yield self.thread_pool.submit(self.blobs.attach, key, sha256)
+        if object_key is None:
+            # the blob has been removed in the meantime
+            self.expiry.unschedule(key)
+            yield self.thread_pool.submit(self.db.delete, "files", {"`key`": key})
+            raise Return(None)
+
+        yield self._enqueue_metadata(key, values)
+        raise Return(key)
+
+    @coroutine
+    def _attach(self, key, values, sha256):
+        """Registers the uploaded object as a blob, or drops it if the same content has been stored before.
+
+        :return: True if the file refers to content stored before
+        """
+        object_key = "%s/%s" % (key, values["name"])
+        blob_key = yield self.thread_pool.submit(self.blobs.attach, key, sha256, object_key, values["size"])
+        if blob_key is None or blob_key == object_key:
+            raise Return(False)
+        self.file_cache.invalidate((key, ))
         try:
-            content_type = utils.normalize_content_type(_content_type, name)
-            yield self.thread_pool.submit(
-                self.s3.upload_file, _file, "%s/%s" % (key, name), content_type, {
-                    "auth": self.current_user["login"]
-                })
+            yield self.thread_pool.submit(self.storage.delete, object_key)
         except Exception as e:
-            yield self.thread_pool.submit(self.db.delete, "files", {"`key`": key})
+            # the sweeper deletes the object with the file, as it differs from the object of the blob
             logging.error(e.message)
-            raise HTTPError(503)
+        raise Return(True)
 
-        metadata = yield self.thread_pool.submit(Metadata, _file, os.path.splitext(_name)[1])
+    @staticmethod
+    def _get_metadata_job(key, values):
+        return "metadata", {"name": values["name"], "size": values["size"]}, key, values["login"]
 
-        def callback(conn):
-            for attribute, value in metadata.iteritems():
-                conn.execute("INSERT INTO meta (`key`, attribute, value) VALUES(?)", (key, attribute, value))
+    @coroutine
+    def _enqueue_metadata(self, key, values):
+        """Schedules metadata extraction, which runs in background after the response and is retried on failures."""
+        yield self.thread_pool.submit(self.jobs.enqueue, *self._get_metadata_job(key, values))
+        self.worker.wake()
 
-        if metadata:
-            yield self.thread_pool.submit(self.db.transaction, callback)
-        self.write({"key": key})
 
+@route(r"/api/upload")
+@stream_request_body
+class UploadHandler(BaseUploadHandler):
+    """Accepts uploads streamed in the request body, which is piped to storage in parts without touching local disk.
+    """
 
-@route(r"/api/files")
-class FilesHandler(BaseHandler):
-    @authenticated
     @coroutine
-    def get(self):
-        def prepare():
-            with self.db.locked() as conn:
-                sqb = conn.sql_builder()
-                sqb.select("f.*", "COUNT(s.key) downloads").from_("files", "f")
-                sqb.left_join("f", "stats", "s", "s.key = f.key AND s.status = ?")
-                sqb.set_parameter(0, BaseHandler.STATS_OK).group_by("f.key")
-                sqb.order_by("f.login").add_order_by("f.name").add_order_by("f.created_at", "DESC")
+    def prepare(self):
+        yield super(UploadHandler, self).prepare()
 
-                if self.check_level(BaseHandler.LEVEL_SUPER):
-                    login = self.get_argument("login", None)
-                else:
-                    login = self.current_user["login"]
+        self._upload = None
+        if not self.current_user:
+            raise HTTPError(403)
 
-                if login:
-                    sqb.and_where("f.login = ?").set_parameter(1, login)
+        try:
+            size = int(self.get_header("Content-Length", 0))
+        except ValueError:
+            raise HTTPError(400)
+        if not size:
+            raise HTTPError(411)
+        if size > options.upload["max_body_size"]:
+            raise HTTPError(413)
+        self.request.connection.set_max_body_size(size)
 
-                folder = self.get_argument("folder", None)
-                if folder is not None:
-                    sqb.and_where("f.folder <=> ?").set_parameter(2, folder or None)
+        values = self._get_values(size)
 
-                search = self.get_argument("search", None)
-                if search:
-                    sqb.and_where("f.name LIKE :search OR f.caption LIKE :search") \
-                        .set_parameter(":search", "%%%s%%" % search)
+        sha256 = self._get_sha256()
+        if sha256 is not None:
+            # the body is not read when the user has uploaded the same content before
+            key = yield self._insert_deduplicated(values, sha256, self.current_user["login"])
+            if key is not None:
+                self.finish({"key": key, "sha256": sha256, "deduplicated": True})
+                return
 
-                return sqb.execute().fetch_all()
+        key = yield self._insert(values)
 
-        files = yield self.thread_pool.submit(prepare)
-        self.write({"files": files})
+        self._upload = {
+            "key": key, "values": values, "hash": hashlib.sha256(),
+            "buffer": [], "buffered": 0, "received": 0, "parts": [], "multipart": None, "error": None
+        }
+
+        if size > options.upload["part_size"]:
+            try:
+                self._upload["multipart"] = yield self.thread_pool.submit(
+                    self.storage.create_multipart_upload, "%s/%s" % (key, values["name"]), self._get_content_type(),
+                    self._get_object_metadata())
+            except Exception as e:
+                upload, self._upload = self._upload, None
+                yield self._cleanup(upload)
+                logging.error(e.message)
+                raise HTTPError(503)
 
-    @authenticated
     @coroutine
-    def delete(self):
-        keys = self.get_body_arguments("keys")
-        if not keys:
+    def _upload_part(self, upload, final=False):
+        data = b"".join(upload["buffer"])
+        part_size = len(data) if final else options.upload["part_size"]
+        data, rest = data[:part_size], data[part_size:]
+        upload["buffer"], upload["buffered"] = [rest] if rest else [], len(rest)
+
+        upload["parts"].append(self.thread_pool.submit(
+            upload["multipart"].upload_part, len(upload["parts"]) + 1, data))
+
+        # back-pressure: stop reading the body while too many parts are in flight
+        pending = [x for x in upload["parts"] if not x.done()]
+        if len(pending) >= options.upload["max_pending_parts"]:
+            yield pending[0]
+
+    @coroutine
+    def data_received(self, chunk):
+        upload = self._upload
+        if upload is None:
+            return
+
+        upload["hash"].update(chunk)
+        upload["received"] += len(chunk)
+        if upload["error"] is not None:
+            return  # drain the rest of the body
+
+        upload["buffer"].append(chunk)
+        upload["buffered"] += len(chunk)
+        if upload["multipart"] is None:
+            return
+
+        try:
+            while upload["buffered"] >= options.upload["part_size"]:
+                yield self._upload_part(upload)
+        except Exception as e:
+            upload["error"] = e
+
+    @coroutine
+    def _cleanup(self, upload):
+        try:
+            if upload["multipart"] is not None:
+                for part in upload["parts"]:
+                    try:
+                        yield part
+                    except Exception:
+                        pass
+                yield self.thread_pool.submit(upload["multipart"].abort)
+        finally:
+            self.expiry.unschedule(upload["key"])
+            yield self.thread_pool.submit(self.db.delete, "files", {"`key`": upload["key"]})
+
+    def on_connection_close(self):
+        super(UploadHandler, self).on_connection_close()
+        if self._upload is not None:
+            # the body was not received completely
+            upload, self._upload = self._upload, None
+            IOLoop.current().spawn_callback(self._cleanup, upload)
+
+    @coroutine
+    def put(self):
+        upload, self._upload = self._upload, None
+        key, name = upload["key"], upload["values"]["name"]
+        sha256 = upload["hash"].hexdigest()
+
+        _sha256 = self._get_sha256()
+        if _sha256 is not None and _sha256 != sha256:
+            yield self._cleanup(upload)
             raise HTTPError(400)
 
-        def prepare():
-            with self.db.locked() as conn:
-                sqb = conn.sql_builder()
-                sqb.select("CONCAT(`key`, '/', name) _").from_("files")
-                sqb.where("`key` IN (?)").set_parameter(0, keys)
+        try:
+            if upload["error"] is not None:
+                raise upload["error"]
+            if upload["multipart"] is None:
+                yield self.thread_pool.submit(
+                    self.storage.put_object, b"".join(upload["buffer"]), "%s/%s" % (key, name),
+                    self._get_content_type(), self._get_object_metadata())
+            else:
+                if upload["buffered"]:
+                    yield self._upload_part(upload, True)
+                parts = yield upload["parts"]
+                yield self.thread_pool.submit(upload["multipart"].complete, parts)
+        except Exception as e:
+            yield self._cleanup(upload)
+            logging.error(e.message)
+            raise HTTPError(503)
 
-                if not self.check_level(BaseHandler.LEVEL_SUPER):
-                    sqb.and_where("login = ?").set_parameter(1, self.current_user["login"])
+        deduplicated = yield self._attach(key, upload["values"], sha256)
+        yield self._enqueue_metadata(key, upload["values"])
+        self.write({"key": key, "sha256": sha256, "deduplicated": deduplicated})
 
-                _keys = sqb.execute().fetch_all(conn.FETCH_COLUMN)
-                try:
-                    self.s3.delete_many(_keys)
-                except Exception as e:
-                    logging.error(e.message)
 
-                _deleted = map(lambda x: x.partition('/')[0], _keys)
-                if _deleted:
-                    conn.delete("files", {"`key`": _deleted})
-                return _deleted
+@route(r"/api/uploads")
+class UploadsHandler(BaseUploadHandler):
+    """Resumable uploads: parts are sent separately (in any order or in parallel) to a reserved key and the file is
+    created once all of them have been received.
 
-        deleted = yield self.thread_pool.submit(prepare)
-        self.write({"deleted": deleted})
+    With "X-SF-Direct" header the data is sent by the client directly to S3, either in a single presigned POST request
+    (files of up to one part) or in parts to presigned URLs. Storage backends without direct uploads ignore the header.
+    """
 
+    MAX_PARTS = 10000
 
-@route(r"/api/files/([a-zA-Z0-9]{8})")
-class FilesEntryHandler(BaseHandler):
-    def _get_file(self, key):
+    def _reserve(self, values):
+        # the key must not be taken by an existing file either
+        columns = sorted(values)
         with self.db.locked() as conn:
-            sqb = conn.sql_builder()
-            sqb.select("*").from_("files")
-            sqb.where("`key` = ?").set_parameter(0, key)
+            while True:
+                key = utils.random_bytes(8)
+                try:
+                    if conn.execute(
+                            "INSERT INTO uploads (`key`, %s) SELECT ? FROM DUAL "
+                            "WHERE NOT EXISTS (SELECT * FROM files WHERE `key` = ?)" % ", ".join(columns),
+                            [key] + [values[x] for x in columns], key):
+                        return key
+                except DBALDriverError:
+                    # Error: 1062 (ER_DUP_ENTRY)
+                    if conn.error_code() != 1062:
+                        raise
 
-            if not self.check_level(BaseHandler.LEVEL_SUPER):
-                sqb.and_where("login = ?").set_parameter(1, self.current_user["login"])
+    @authenticated
+    @coroutine
+    def post(self):
+        try:
+            size = int(self.get_header("X-SF-Size"))
+        except ValueError:
+            raise HTTPError(400)
+        if size <= 0:
+            raise HTTPError(411)
+        if size > options.upload["max_body_size"]:
+            raise HTTPError(413)
 
-            file_ = sqb.execute().fetch()
-        if not file_:
+        _direct = self.get_header("X-SF-Direct", "0")
+        if _direct not in ("0", "1"):
+            raise HTTPError(400)
+
+        values = self._get_values(size)
+
+        sha256 = self._get_sha256()
+        if sha256 is not None:
+            key = yield self._insert_deduplicated(values, sha256, self.current_user["login"])
+            if key is not None:
+                self.write({"key": key, "size": size, "deduplicated": True})
+                return
+
+        # S3 accepts up to 10000 parts per upload
+        values["part_size"] = max(options.upload["part_size"], self._count_parts(size, UploadsHandler.MAX_PARTS))
+        if _direct == "0" or not self.storage.SUPPORTS_DIRECT:
+            values["mode"] = BaseUploadHandler.MODE_PROXY
+        elif size <= values["part_size"]:
+            values["mode"] = BaseUploadHandler.MODE_POST
+        else:
+            values["mode"] = BaseUploadHandler.MODE_DIRECT
+
+        key = yield self.thread_pool.submit(self._reserve, values)
+        object_key = "%s/%s" % (key, values["name"])
+        content_type = self._get_content_type("X-SF-Content-Type")
+
+        if values["mode"] == BaseUploadHandler.MODE_POST:
+            post = self.storage.presigned_post(
+                object_key, size, options.upload["direct_url_lifetime"], content_type, self._get_object_metadata())
+            self.write({"key": key, "size": size, "post": post})
+            return
+
+        try:
+            multipart = yield self.thread_pool.submit(
+                self.storage.create_multipart_upload, object_key, content_type, self._get_object_metadata())
+            yield self.thread_pool.submit(
+                self.db.update, "uploads", {"upload_id": multipart.upload_id}, {"`key`": key})
+        except Exception as e:
+            yield self.thread_pool.submit(self.db.delete, "uploads", {"`key`": key})
+            logging.error(e.message)
+            raise HTTPError(503)
+
+        self.write({
+            "key": key, "size": size, "part_size": values["part_size"],
+            "parts": self._count_parts(size, values["part_size"]),
+            "direct": values["mode"] == BaseUploadHandler.MODE_DIRECT
+        })
+
+
+class BaseUploadsEntryHandler(BaseUploadHandler):
+    def _get_upload(self, key):
+        upload = self.db.fetch(
+            "SELECT * FROM uploads WHERE `key` = ? AND login = ? AND (upload_id IS NOT NULL OR mode = ?)",
+            key, self.current_user["login"], BaseUploadHandler.MODE_POST)
+        if not upload:
             raise HTTPError(404)
-        return file_
+        return upload
+
+    def _get_part_size(self, upload, number):
+        count = self._count_parts(upload["size"], upload["part_size"])
+        if upload["mode"] == BaseUploadHandler.MODE_POST or not 1 <= number <= count:
+            raise HTTPError(400)
+        # all parts but the last one are of the same size
+        return upload["part_size"] if number < count else upload["size"] - upload["part_size"] * (count - 1)
+
+    def _get_multipart_upload(self, upload):
+        return self.storage.get_multipart_upload("%s/%s" % (upload["key"], upload["name"]), upload["upload_id"])
 
+
+@route(r"/api/uploads/([a-zA-Z0-9]{8})")
+class UploadsEntryHandler(BaseUploadsEntryHandler):
     @authenticated
     @coroutine
     def get(self, key):
-        file_ = yield self.thread_pool.submit(self._get_file, key)
-        file_["is_permanent"] = not file_["expires_at"]
-        file_["downloads"] = yield self.thread_pool.submit(
-            self.db.fetch_column, "SELECT COUNT(*) FROM stats WHERE `key` = ? AND status = ? AND deleted_at IS NULL",
-            key, BaseHandler.STATS_OK)
+        upload = yield self.thread_pool.submit(self._get_upload, key)
+        parts = yield self.thread_pool.submit(
+            self.db.fetch_all, "SELECT number FROM upload_parts WHERE `key` = ? ORDER BY number", key)
+        parts = [x["number"] for x in parts]
+
+        # received byte ranges, with adjacent parts merged
+        ranges, part_size = [], upload["part_size"]
+        for number in parts:
+            start, end = (number - 1) * part_size, min(number * part_size, upload["size"])
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
 
-        metadata = yield self.thread_pool.submit(
-            self.db.fetch_all, "SELECT attribute, value FROM meta WHERE `key` = ?", key)
-        file_["metadata"] = {meta["attribute"]: meta["value"] for meta in metadata}
-        file_["mimetype"] = utils.normalize_content_type(filename=file_["name"])
-        self.write(file_)
+        self.write({
+            "key": key, "name": upload["name"], "size": upload["size"], "part_size": part_size,
+            "parts": self._count_parts(upload["size"], part_size), "received": parts, "ranges": ranges
+        })
 
     @authenticated
     @coroutine
-    def patch(self, key):
+    def post(self, key):
+        upload = yield self.thread_pool.submit(self._get_upload, key)
+
+        try:
+            if upload["mode"] != BaseUploadHandler.MODE_POST:
+                multipart = self._get_multipart_upload(upload)
+                if upload["mode"] == BaseUploadHandler.MODE_DIRECT:
+                    parts = yield self.thread_pool.submit(multipart.list_parts)
+                    parts = [{"number": x["PartNumber"], "size": x["Size"], "etag": x["ETag"]} for x in parts]
+                else:
+                    parts = yield self.thread_pool.submit(
+                        self.db.fetch_all, "SELECT number, size, etag FROM upload_parts WHERE `key` = ? "
+                        "ORDER BY number", key)
+
+                # every part must have been received in full
+                count = self._count_parts(upload["size"], upload["part_size"])
+                if [(x["number"], x["size"]) for x in parts] != [
+                        (x, self._get_part_size(upload, x)) for x in range(1, count + 1)]:
+                    raise HTTPError(409)
+
+                yield self.thread_pool.submit(multipart.complete, [
+                    {"PartNumber": x["number"], "ETag": x["etag"]} for x in parts
+                ])
+
+            stat = yield self.thread_pool.submit(self.storage.stat, "%s/%s" % (key, upload["name"]))
+        except HTTPError:
+            raise
+        except Exception as e:
+            logging.error(e.message)
+            raise HTTPError(503)
+
+        if stat is None or stat["size"] != upload["size"]:
+            raise HTTPError(409)
+
+        values = dict((x, upload[x]) for x in (
+            "login", "name", "size", "folder", "caption", "password", "is_public", "expires_at"))
+
+        def callback(conn):
+            conn.insert("files", dict(values, **{"`key`": key}))
+            search_index.reindex(conn, (key, ))
+            conn.delete("uploads", {"`key`": key})
+            self.jobs.enqueue(*self._get_metadata_job(key, values), conn=conn)
+            # parts are not hashed on the way, the content is read back to find duplicates
+            self.jobs.enqueue("checksum", None, key, values["login"], conn=conn)
+
+        yield self.thread_pool.submit(self.db.transaction, callback)
+        self.expiry.schedule(key, values["expires_at"])
+        self.worker.wake()
+        self.write({"key": key})
+
+    @authenticated
+    @coroutine
+    def delete(self, key):
+        upload = yield self.thread_pool.submit(self._get_upload, key)
+        aborted = yield self.thread_pool.submit(self.sweeper.abort_uploads, (upload, ))
+        if not aborted:
+            raise HTTPError(503)
+        self.status_ok()
+
+
+@route(r"/api/uploads/([a-zA-Z0-9]{8})/(\d{1,5})")
+class UploadsPartHandler(BaseUploadsEntryHandler):
+    @authenticated
+    @coroutine
+    def get(self, key, number):
+        if not self.storage.SUPPORTS_DIRECT:
+            raise HTTPError(400)
+
+        number = int(number)
+        upload = yield self.thread_pool.submit(self._get_upload, key)
+
+        # URL for uploading the part directly to S3
+        size = self._get_part_size(upload, number)
+        url = self._get_multipart_upload(upload).part_url(number, options.upload["direct_url_lifetime"])
+        self.write({"key": key, "number": number, "size": size, "url": url})
+
+    @authenticated
+    @coroutine
+    def put(self, key, number):
+        number = int(number)
+        upload = yield self.thread_pool.submit(self._get_upload, key)
+
+        size = self._get_part_size(upload, number)
+        if len(self.request.body) != size:
+            raise HTTPError(400)
+
+        try:
+            part = yield self.thread_pool.submit(
+                self._get_multipart_upload(upload).upload_part, number, self.request.body)
+        except Exception as e:
+            logging.error(e.message)
+            raise HTTPError(503)
+
+        def callback(conn):
+            conn.execute(
+                "INSERT INTO upload_parts (`key`, number, size, etag) VALUES (?) "
+                "ON DUPLICATE KEY UPDATE size = VALUES(size), etag = VALUES(etag)", (key, number, size, part["ETag"]))
+            conn.execute("UPDATE uploads SET updated_at = NOW() WHERE `key` = ?", key)
+
+        yield self.thread_pool.submit(self.db.transaction, callback)
+        self.write({"key": key, "number": number, "size": size})
+
+
+class BaseFilesHandler(BaseHandler):
+    def _get_changes(self):
         _password = self.get_body_argument("password", None)
         _caption = self.get_body_argument("caption", None)
         _folder = self.get_body_argument("folder", None)
         _is_public = self.get_body_argument("is_public", None)
         _is_permanent = self.get_body_argument("is_permanent", None)
 
-        yield self.thread_pool.submit(self._get_file, key)
-
         values = {}
         if _password is not None:
             values["password"] = _password[:72] or None
@@ -295,7 +650,7 @@ class FilesEntryHandler(BaseHandler):
             values["is_public"] = _is_public
         if _is_permanent is not None:
             if _is_permanent == "0":
-                expires_at = self.s3.get_expiry_date()
+                expires_at = self.storage.get_expiry_date()
             elif _is_permanent == "1":
                 expires_at = None
             else:
@@ -306,9 +661,237 @@ class FilesEntryHandler(BaseHandler):
 
         if not values:
             raise HTTPError(400)
+        return values
 
-        yield self.thread_pool.submit(
-            self.db.update, "files", values, {"`key`": key})
+
+@route(r"/api/files")
+class FilesHandler(BaseFilesHandler):
+    PAGE_MAX_SIZE = 1000
+    PATCH_MAX_SIZE = 1000
+    DELETE_MAX_SIZE = 5000
+    STREAM_CHUNK_SIZE = 500
+
+    @staticmethod
+    def _get_keyset(file_):
+        return utils.normalize_chunk([file_["login"], file_["name"], file_["created_at"], file_["key"]])
+
+    def _get_files(self, limit, cursor=None):
+        """Fetches files ordered by (login, name, created_at, key) starting after the cursor.
+
+        :param limit: maximum number of files, `None` for a streaming chunk (ranked results are capped at a page)
+        :param cursor: keyset of the last file of the previous chunk
+        :return: files and whether they are ranked by search relevance (and can not be paginated)
+        :rtype: tuple
+        """
+        with self.db.locked() as conn:
+            sqb = conn.sql_builder()
+            sqb.select("f.*").from_("files", "f")
+
+            if self.check_level(BaseHandler.LEVEL_SUPER):
+                login = self.get_argument("login", None)
+            else:
+                login = self.current_user["login"]
+
+            if login:
+                sqb.and_where("f.login = ?").set_parameter(1, login)
+
+            folder = self.get_argument("folder", None)
+            if folder is not None:
+                sqb.and_where("f.folder <=> ?").set_parameter(2, folder or None)
+
+            search = self.get_argument("search", None)
+            query = search and search_index.match_query(search, self.get_argument("match", "prefix") == "prefix")
+            if query:
+                # ranked full-text search over name, caption, folder and metadata
+                sqb.add_select("MATCH(s.content) AGAINST(:search IN BOOLEAN MODE) score")
+                sqb.inner_join("f", "search", "s", "s.key = f.key")
+                sqb.and_where("MATCH(s.content) AGAINST(:search IN BOOLEAN MODE)").set_parameter(":search", query)
+                sqb.order_by("score", "DESC")
+            elif search:
+                # too short to be indexed
+                sqb.and_where("f.name LIKE :search OR f.caption LIKE :search") \
+                    .set_parameter(":search", "%%%s%%" % search)
+
+            if cursor and not query:
+                # row comparisons on the `login_name` index (and the primary key it carries) are range scans;
+                # files without an owner sort first, and NULL can not take part in a row comparison
+                c_login, c_name, c_created_at, c_key = cursor
+                if login:
+                    sqb.and_where("(f.name, f.created_at, f.key) > (:c_name, :c_created_at, :c_key)")
+                elif c_login:
+                    sqb.and_where("(f.login, f.name, f.created_at, f.key) > "
+                                  "(:c_login, :c_name, :c_created_at, :c_key)").set_parameter(":c_login", c_login)
+                else:
+                    sqb.and_where("f.login IS NULL AND (f.name, f.created_at, f.key) > "
+                                  "(:c_name, :c_created_at, :c_key) OR f.login IS NOT NULL")
+                sqb.set_parameter(":c_name", c_name)
+                sqb.set_parameter(":c_created_at", c_created_at)
+                sqb.set_parameter(":c_key", c_key)
+
+            if not query:
+                sqb.order_by("f.login").add_order_by("f.name").add_order_by("f.created_at").add_order_by("f.key")
+                sqb.set_max_results(limit or FilesHandler.STREAM_CHUNK_SIZE)
+            else:
+                sqb.add_order_by("f.key")
+                sqb.set_max_results(min(limit or FilesHandler.PAGE_MAX_SIZE, FilesHandler.PAGE_MAX_SIZE))
+            return sqb.execute().fetch_all(), bool(query)
+
+    @authenticated
+    @coroutine
+    def get(self):
+        _limit = self.get_argument("limit", None)
+        _cursor = self.get_argument("cursor", None)
+
+        cursor = None
+        if _cursor:
+            cursor = utils.decode_cursor(_cursor, 4)
+            if cursor is None:
+                raise HTTPError(400)
+
+        if _limit is not None:
+            try:
+                limit = int(_limit)
+            except ValueError:
+                raise HTTPError(400)
+            if not 0 < limit <= FilesHandler.PAGE_MAX_SIZE:
+                raise HTTPError(400)
+
+            files, is_ranked = yield self.thread_pool.submit(self._get_files, limit, cursor)
+            next_cursor = None
+            if len(files) == limit and not is_ranked:
+                next_cursor = utils.encode_cursor(*FilesHandler._get_keyset(files[-1]))
+            self.write({"files": files, "cursor": next_cursor})
+            return
+
+        # without a limit all files are streamed in chunks, so memory use does not grow with the result
+        callback = self.get_json_callback()
+        if callback:
+            self.set_header("Content-Type", "text/javascript; charset=UTF-8")
+            self.write('/**/%s({"files": [' % callback)
+        else:
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+            self.write('{"files": [')
+
+        separator = ""
+        while True:
+            files, is_ranked = yield self.thread_pool.submit(self._get_files, None, cursor)
+            if files:
+                self.write(separator + json_encode(utils.normalize_chunk(files))[1:-1])
+                separator = ", "
+                yield self.flush()
+            if is_ranked or len(files) < FilesHandler.STREAM_CHUNK_SIZE:
+                break
+            cursor = FilesHandler._get_keyset(files[-1])
+
+        self.write("]});" if callback else "]}")
+
+    @authenticated
+    @coroutine
+    def patch(self):
+        """Applies the same changes to many files (e.g. moves them to a folder or publishes them) at once."""
+        keys = list(set(self.get_body_arguments("keys")))
+        if not keys:
+            raise HTTPError(400)
+        if len(keys) > FilesHandler.PATCH_MAX_SIZE:
+            raise HTTPError(413)
+        values = self._get_changes()
+
+        def callback(conn):
+            sqb = conn.sql_builder()
+            sqb.select("`key`", "login").from_("files")
+            sqb.where("`key` IN (?)").set_parameter(0, keys)
+
+            if not self.check_level(BaseHandler.LEVEL_SUPER):
+                sqb.and_where("login = ?").set_parameter(1, self.current_user["login"])
+
+            files = sqb.execute().fetch_all()
+            if files:
+                conn.update("files", values, {"`key`": [x["key"] for x in files]})
+                if "caption" in values or "folder" in values:
+                    search_index.reindex(conn, [x["key"] for x in files])
+            return files
+
+        files = yield self.thread_pool.submit(self.db.transaction, callback)
+        self.file_cache.invalidate([x["key"] for x in files])
+        if "expires_at" in values:
+            for x in files:
+                self.expiry.schedule(x["key"], values["expires_at"])
+
+        updated = set(x["key"] for x in files)
+        self.write({"results": {x: "updated" if x in updated else "not_found" for x in keys}})
+
+    @authenticated
+    @coroutine
+    def delete(self):
+        """Accepts deletion of files as a background job, its progress is available at "/api/jobs/<id>"."""
+        keys = list(set(self.get_body_arguments("keys")))
+        if not keys:
+            raise HTTPError(400)
+        if len(keys) > FilesHandler.DELETE_MAX_SIZE:
+            raise HTTPError(413)
+
+        login = None if self.check_level(BaseHandler.LEVEL_SUPER) else self.current_user["login"]
+        job_id = yield self.thread_pool.submit(
+            self.jobs.enqueue, "delete", {"keys": keys, "login": login}, None, self.current_user["login"])
+        self.worker.wake()
+
+        self.set_status(202)
+        self.set_header("Location", self.reverse_url("api_jobs_entry", job_id))
+        self.write({"job": job_id})
+
+
+@route(r"/api/files/([a-zA-Z0-9]{8})")
+class FilesEntryHandler(BaseFilesHandler):
+    def _get_file(self, key):
+        with self.db.locked() as conn:
+            sqb = conn.sql_builder()
+            sqb.select("*").from_("files")
+            sqb.where("`key` = ?").set_parameter(0, key)
+
+            if not self.check_level(BaseHandler.LEVEL_SUPER):
+                sqb.and_where("login = ?").set_parameter(1, self.current_user["login"])
+
+            file_ = sqb.execute().fetch()
+        if not file_:
+            raise HTTPError(404)
+        return file_
+
+    @authenticated
+    @coroutine
+    def get(self, key):
+        file_ = yield self.thread_pool.submit(self._get_file, key)
+        file_["is_permanent"] = not file_["expires_at"]
+
+        metadata = yield self.thread_pool.submit(
+            self.db.fetch_all, "SELECT attribute, value FROM meta WHERE `key` = ?", key)
+        file_["metadata"] = {meta["attribute"]: meta["value"] for meta in metadata}
+        file_["mimetype"] = utils.normalize_content_type(filename=file_["name"])
+
+        job = yield self.thread_pool.submit(self.jobs.get_latest, key, "metadata")
+        if job is not None:
+            file_["processing"] = {
+                "status": job["status"], "attempts": job["attempts"], "error": job["error"],
+                "updated_at": job["updated_at"]
+            }
+        else:
+            file_["processing"] = None
+        self.write(file_)
+
+    @authenticated
+    @coroutine
+    def patch(self, key):
+        values = self._get_changes()
+        file_ = yield self.thread_pool.submit(self._get_file, key)
+
+        def callback(conn):
+            conn.update("files", values, {"`key`": key})
+            if "caption" in values or "folder" in values:
+                search_index.reindex(conn, (key, ))
+
+        yield self.thread_pool.submit(self.db.transaction, callback)
+        self.file_cache.invalidate((key, ))
+        if "expires_at" in values:
+            self.expiry.schedule(key, values["expires_at"])
         self.status_ok()
 
     @authenticated
@@ -316,16 +899,32 @@ class FilesEntryHandler(BaseHandler):
     def delete(self, key):
         file_ = yield self.thread_pool.submit(self._get_file, key)
         try:
-            yield self.thread_pool.submit(
-                self.s3.delete, "%s/%s" % (key, file_["name"]))
+            files = yield self.thread_pool.submit(self.sweeper.fetch, [key])
+            deleted = yield self.thread_pool.submit(self.sweeper.delete, files)
         except Exception as e:
             logging.error(e.message)
             raise HTTPError(503)
+        if not deleted:
+            raise HTTPError(503)
 
-        yield self.thread_pool.submit(self.db.delete, "files", {"`key`": key})
+        self.file_cache.invalidate((key, ))
+        self.expiry.unschedule(key)
         self.status_ok()
 
 
+@route(r"/api/jobs/([0-9]+)")
+class JobsEntryHandler(BaseHandler):
+    @authenticated
+    @coroutine
+    def get(self, id_):
+        login = None if self.check_level(BaseHandler.LEVEL_SUPER) else self.current_user["login"]
+        job = yield self.thread_pool.submit(self.jobs.get, int(id_), login)
+        if not job:
+            raise HTTPError(404)
+        self.write(dict((x, job[x]) for x in (
+            "id", "type", "key", "status", "attempts", "error", "result", "created_at", "updated_at")))
+
+
 @route(r"/api/feed")
 class FeedHandler(BaseHandler):
     @authenticated
@@ -350,7 +949,7 @@ class FeedHandler(BaseHandler):
         yield self.thread_pool.submit(
             self.db.execute, "INSERT INTO feeds (login, password, title, readme, is_enabled) VALUES(?) "
             "ON DUPLICATE KEY UPDATE login=VALUES(login), password=VALUES(password), title=VALUES(title), "
-            "readme=VALUES(readme), is_enabled=VALUES(is_enabled)",
+            "readme=VALUES(readme), is_enabled=VALUES(is_enabled), version=version + 1",
             (self.current_user["login"], _password or None, _title or None, _readme or None, _is_enabled))
         self.status_ok()
 
@@ -402,16 +1001,21 @@ class UsersHandler(BaseHandler):
         if _is_enabled not in ("0", "1"):
             raise HTTPError(400)
 
-        with self.db.locked() as conn:
-            try:
-                yield self.thread_pool.submit(
-                    conn.execute, "INSERT INTO users (login, password, level, is_enabled) VALUES(?)",
-                    (_login,  utils.hash_password(_password), _level, _is_enabled))
-            except DBALDriverError:
-                # Error: 1062 (ER_DUP_ENTRY)
-                if conn.error_code() == 1062:
-                    raise HTTPError(409)
-                raise
+        password = yield self.hash_password(_password)
+
+        def prepare():
+            with self.db.locked() as conn:
+                try:
+                    conn.execute(
+                        "INSERT INTO users (login, password, level, is_enabled) VALUES(?)",
+                        (_login, password, _level, _is_enabled))
+                except DBALDriverError:
+                    # Error: 1062 (ER_DUP_ENTRY)
+                    if conn.error_code() == 1062:
+                        raise HTTPError(409)
+                    raise
+
+        yield self.thread_pool.submit(prepare)
         self.status_ok()
 
 
@@ -467,7 +1071,7 @@ class UsersEntryHandler(BaseHandler):
             values["level"] = _level
 
         if _password:
-            values["password"] = utils.hash_password(_password)
+            values["password"] = yield self.hash_password(_password)
 
         if _is_enabled is not None:
             if _is_enabled not in ("0", "1"):
@@ -479,15 +1083,17 @@ class UsersEntryHandler(BaseHandler):
 
         yield self.thread_pool.submit(self._get_user, login)
 
-        with self.db.locked() as conn:
-            try:
-                yield self.thread_pool.submit(
-                    conn.update, "users", values, {"login": login})
-            except DBALDriverError:
-                # Error: 1062 (ER_DUP_ENTRY)
-                if conn.error_code() == 1062:
-                    raise HTTPError(409)
-                raise
+        def prepare():
+            with self.db.locked() as conn:
+                try:
+                    conn.update("users", values, {"login": login})
+                except DBALDriverError:
+                    # Error: 1062 (ER_DUP_ENTRY)
+                    if conn.error_code() == 1062:
+                        raise HTTPError(409)
+                    raise
+
+        yield self.thread_pool.submit(prepare)
         self.status_ok()
 
     @check_level(
@@ -521,7 +1127,7 @@ class UsersEntryTokenHandler(BaseHandler):
     @check_level(BaseHandler.LEVEL_SUPER)
     @coroutine
     def get(self, login):
-        self._check_user(login)
+        yield self.thread_pool.submit(self._check_user, login)
         token = yield self.thread_pool.submit(
             self.db.fetch_column, "SELECT session FROM sess WHERE login = ? AND expires_at IS NULL", login)
         self.write({"token": token})
@@ -529,7 +1135,7 @@ class UsersEntryTokenHandler(BaseHandler):
     @check_level(BaseHandler.LEVEL_SUPER)
     @coroutine
     def post(self, login):
-        self._check_user(login)
+        yield self.thread_pool.submit(self._check_user, login)
 
         def callback(conn):
             session = utils.random_bytes()
@@ -543,7 +1149,7 @@ class UsersEntryTokenHandler(BaseHandler):
     @check_level(BaseHandler.LEVEL_SUPER)
     @coroutine
     def delete(self, login):
-        self._check_user(login)
+        yield self.thread_pool.submit(self._check_user, login)
         yield self.thread_pool.submit(
             self.db.execute, "DELETE FROM sess WHERE login = ? AND expires_at IS NULL", login)
         self.status_ok()
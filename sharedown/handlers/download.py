@@ -26,41 +26,81 @@ import os.path
 import utils
 
 from tornado.web import HTTPError
-from tornado.gen import coroutine
+from tornado.gen import coroutine, Return
+from utils.storage import Storage
+from utils.filesystem import FileSystem
 
 from . import BaseHandler, route
 
 
+class BaseDownloadHandler(BaseHandler):
+    def _fetch_file(self, key):
+        generation = self.file_cache.generation()
+        with self.db.locked() as conn:
+            file_ = conn.query(
+                "SELECT f.*, b.object FROM files f LEFT JOIN blobs b ON b.sha256 = f.sha256 WHERE f.`key` = ? "
+                "AND (f.expires_at IS NULL OR f.expires_at > NOW())", key).fetch()
+            if not file_:
+                return None
+            metadata = conn.query("SELECT attribute, value FROM meta WHERE `key` = ?", key).fetch_all()
+
+        entry = {"file": file_, "metadata": {meta["attribute"]: meta["value"] for meta in metadata}}
+        self.file_cache.set(key, entry, generation)
+        return entry
+
+    @coroutine
+    def _get_entry(self, key):
+        """Returns the file record with its metadata, shared links are mostly served from the cache."""
+        entry = self.file_cache.get(key)
+        if entry is None:
+            entry = yield self.thread_pool.submit(self._fetch_file, key)
+            if entry is None:
+                raise HTTPError(404)
+        raise Return(entry)
+
+
 @route(r"/dl/([a-zA-Z0-9]{8})")
-class IndexHandler(BaseHandler):
-    def _get_file(self, key):
-        file_ = self.db.fetch(
-            "SELECT * FROM files WHERE `key` = ? AND (expires_at IS NULL OR expires_at > NOW())", key)
-        if not file_:
-            raise HTTPError(404)
-        return file_
+class IndexHandler(BaseDownloadHandler):
+    """Renders download page for browsers and redirects other clients (or requests with "?direct=1") straight to
+    the file, password protected files are then downloaded with "X-SF-Password" header.
+    """
+
+    def _is_direct(self):
+        _direct = self.get_argument("direct", None)
+        if _direct is not None:
+            if _direct not in ("0", "1"):
+                raise HTTPError(400)
+            return _direct == "1"
+        # browsers ask for HTML, while download tools and package managers accept anything
+        return "text/html" not in self.get_header("Accept", "")
+
+    def _check_password(self, file_):
+        if file_["password"] is None:
+            return
+        _password = self.get_header("X-SF-Password", None)
+        if _password != file_["password"]:
+            if _password is not None:
+                self._set_stats(file_, BaseHandler.STATS_FAIL)
+            raise HTTPError(403)
 
     def _set_stats(self, file_, status):
-        self.db.execute(
-            "INSERT INTO stats (`key`, name, status, ip) VALUES(?)",
-            (file_["key"], file_["name"], status, self.remote_ip))
+        if self.stats.append(file_["key"], file_["name"], status, self.remote_ip):
+            self.thread_pool.submit(self.application.flush_stats)
 
     def _get_url(self, file_):
         try:
-            url = self.s3.download_url("%s/%s" % (file_["key"], file_["name"]))
+            url = self.storage.download_url(Storage.object_key(file_), file_["name"])
         except:
             raise HTTPError(503)
         self._set_stats(file_, BaseHandler.STATS_OK)
         return url
 
-    @coroutine
-    def _display_url(self, file_, url):
+    def _display_url(self, entry, url):
+        file_ = entry["file"]
         agent = self.get_header("User-Agent", "").lower()
         if any(x in agent for x in ("iphone", "ipod", "ipad")):
             if os.path.splitext(file_["name"])[1] == ".ipa":
-                family = yield self.thread_pool.submit(
-                    self.db.fetch_column, "SELECT LOWER(value) FROM meta WHERE `key` = ? AND attribute = ?",
-                    file_["key"], "device-family")
+                family = (entry["metadata"].get("device-family") or "").lower()
                 if family == "iphone" and "ipad" in agent:
                     self.set_flash(
                         "This application is designed for iPhone. Please try it on an iPhone for a better experience.",
@@ -75,42 +115,127 @@ class IndexHandler(BaseHandler):
                 )
         self.render("download/index.html", file=file_, url=url)
 
+    @coroutine
+    def head(self, key):
+        entry = yield self._get_entry(key)
+        file_ = entry["file"]
+        self._check_password(file_)
+
+        self.set_header("Content-Type", utils.normalize_content_type(filename=file_["name"]))
+        self.set_header("Content-Length", file_["size"])
+
     @coroutine
     def get(self, key):
-        file_ = yield self.thread_pool.submit(self._get_file, key)
-        if file_["password"] is not None:
+        self.set_header("Vary", "Accept")
+        entry = yield self._get_entry(key)
+        if self._is_direct():
+            self._check_password(entry["file"])
+            url = yield self.thread_pool.submit(self._get_url, entry["file"])
+            # the presigned URL is short-lived
+            self.set_header("Cache-Control", "no-store")
+            self.redirect(url)
+            return
+
+        if entry["file"]["password"] is not None:
             self.render("download/password.html")
             return
 
-        url = yield self.thread_pool.submit(self._get_url, file_)
-        yield self._display_url(file_, url)
+        url = yield self.thread_pool.submit(self._get_url, entry["file"])
+        self._display_url(entry, url)
 
     @coroutine
     def post(self, key):
         _password = self.get_body_argument("password")
 
-        file_ = yield self.thread_pool.submit(self._get_file, key)
+        entry = yield self._get_entry(key)
+        file_ = entry["file"]
         if file_["password"] != _password:
-            yield self.thread_pool.submit(self._set_stats, file_, BaseHandler.STATS_FAIL)
+            self._set_stats(file_, BaseHandler.STATS_FAIL)
             self.set_flash("The password you entered is incorrect.", BaseHandler.FLASH_ERROR)
             self.redirect(self.reverse_url("download_index", key))
             return
 
         url = yield self.thread_pool.submit(self._get_url, file_)
-        self._display_url(file_, url)
+        self._display_url(entry, url)
 
 
 @route(r"/dl/([a-zA-Z0-9]{8})/manifest.plist:(.+)")
-class ManifestHandler(BaseHandler):
+class ManifestHandler(BaseDownloadHandler):
     @coroutine
     def get(self, key, token):
         url = utils.untokenize_value(self.cookie_secret, token)
         if not url:
             raise HTTPError(403)
 
-        _metadata = yield self.thread_pool.submit(
-            self.db.fetch_all, "SELECT attribute, value FROM meta WHERE `key` = ?", key)
-        metadata = {meta["attribute"]: meta["value"] for meta in _metadata}
-
+        entry = yield self._get_entry(key)
         self.set_header("Content-Type", "application/xml")
-        self.render("download/manifest.plist", url=url, metadata=metadata)
+        self.render("download/manifest.plist", url=url, metadata=entry["metadata"])
+
+
+@route(r"/dl/([a-zA-Z0-9]{8})/icon-(\d+)\.png")
+class IconHandler(BaseDownloadHandler):
+    def compute_etag(self):
+        return '"%s-%s"' % tuple(self.path_args)
+
+    @coroutine
+    def get(self, key, size):
+        size = int(size)
+        if size not in Storage.ICON_SIZES:
+            raise HTTPError(404)
+
+        entry = yield self._get_entry(key)
+        if not entry["file"]["has_icon"]:
+            raise HTTPError(404)
+
+        self.set_header("Cache-Control", Storage.ICON_CACHE_CONTROL)
+        self.set_etag_header()
+        if self.check_etag_header():
+            # icons never change once stored, so revalidation does not need to fetch them
+            self.set_status(304)
+            return
+
+        try:
+            icon = yield self.thread_pool.submit(self.storage.get_object, Storage.icon_key(key, size))
+        except:
+            raise HTTPError(503)
+        if icon is None:
+            raise HTTPError(404)
+
+        self.set_header("Content-Type", "image/png")
+        self.write(icon)
+
+
+@route(r"/storage/([a-zA-Z0-9_=-]+)")
+class StorageHandler(BaseHandler):
+    """Serves files of the filesystem storage by download URLs it has signed. With "X-Accel-Redirect" the data is sent
+    by the front proxy, otherwise it is streamed from disk.
+    """
+
+    @coroutine
+    def get(self, token):
+        if not isinstance(self.storage, FileSystem):
+            raise HTTPError(404)
+
+        resolved = self.storage.resolve_url(token)
+        if resolved is None:
+            raise HTTPError(403)
+        key, filename = resolved
+
+        self.set_header("Content-Type", utils.normalize_content_type(filename=filename))
+        self.set_header("Content-Disposition", utils.content_disposition(filename))
+        if self.storage.accel_redirect is not None:
+            self.set_header("X-Accel-Redirect", self.storage.accel_redirect_path(key))
+            return
+
+        try:
+            f = open(self.storage.path(key), "rb")
+        except IOError:
+            raise HTTPError(404)
+        with f:
+            self.set_header("Content-Length", os.fstat(f.fileno()).st_size)
+            while True:
+                chunk = yield self.thread_pool.submit(f.read, FileSystem.COPY_BUFFER_SIZE)
+                if not chunk:
+                    break
+                self.write(chunk)
+                yield self.flush()
@@ -23,10 +23,15 @@
 from __future__ import absolute_import, division, print_function, with_statement
 
 import utils
+import hashlib
+import calendar
+import email.utils
 
+from datetime import datetime
 from itertools import groupby
 from collections import OrderedDict
 from tornado.web import HTTPError
+from tornado.escape import json_encode
 from tornado.gen import coroutine
 from feedgen.feed import FeedGenerator
 
@@ -43,8 +48,9 @@ class IndexHandler(BaseHandler):
 
     def _display_feed(self, feed):
         files = self.db.fetch_all(
-            "SELECT `key`, name, size, folder, COALESCE(caption, name) caption, created_at FROM files WHERE login = ? "
-            "AND is_public = TRUE AND (expires_at IS NULL OR expires_at > NOW()) ORDER BY folder, caption",
+            "SELECT `key`, name, size, folder, COALESCE(caption, name) caption, has_icon, created_at FROM files "
+            "WHERE login = ? AND is_public = TRUE AND (expires_at IS NULL OR expires_at > NOW()) "
+            "ORDER BY folder, caption",
             feed["login"])
 
         folders = OrderedDict()
@@ -78,25 +84,22 @@ class IndexHandler(BaseHandler):
 
 @route(r"/feed/([\w.-]{1,32})/(json|rss.xml|atom.xml)")
 class ExportHandler(BaseHandler):
-    @coroutine
-    def get(self, login, format_):
-        feed = yield self.thread_pool.submit(
-            self.db.fetch, "SELECT * FROM feeds WHERE login = ? AND is_enabled = TRUE", login)
-        if not feed:
-            raise HTTPError(404)
-
-        if feed["password"] and not self.http_basic_auth(feed["login"], feed["password"]):
-            return  # request HTTP basic authentication to protect the feed
-
-        files = yield self.thread_pool.submit(
-            self.db.fetch_all,
+    CONTENT_TYPES = {
+        "json": "application/json; charset=UTF-8",
+        "rss.xml": "application/xml; charset=UTF-8",
+        "atom.xml": "application/xml; charset=UTF-8",
+    }
+
+    def _render(self, feed, format_):
+        login = feed["login"]
+        files = self.db.fetch_all(
             "SELECT `key`, login, name, size, folder, caption, expires_at, created_at FROM files "
             "WHERE login = ? AND is_public = TRUE AND (expires_at IS NULL OR expires_at > NOW()) "
             "ORDER BY name", login)
 
         if format_ == "json":
-            self.write({"feed": files})
-        elif format_.endswith(".xml"):
+            body = json_encode(utils.normalize_chunk({"feed": files}))
+        else:
             fg = FeedGenerator()
             fg.title(feed["title"] or login)
             fg.description(login + ": Sharedown")
@@ -113,9 +116,55 @@ class ExportHandler(BaseHandler):
                 if file_["folder"]:
                     fe.category(term=file_["folder"])
 
-            if format_ == "atom.xml":
-                self.set_header("Content-Type", "application/xml; charset=UTF-8")
-                self.write(fg.atom_str(True))
-            elif format_ == "rss.xml":
-                self.set_header("Content-Type", "application/xml; charset=UTF-8")
-                self.write(fg.rss_str(True))
+            body = fg.atom_str(True) if format_ == "atom.xml" else fg.rss_str(True)
+
+        return {
+            "body": body,
+            "etag": '"%s"' % hashlib.sha1(body).hexdigest(),
+            "modified": datetime.utcnow().replace(microsecond=0),
+        }
+
+    def _is_not_modified(self, modified):
+        if "If-None-Match" in self.request.headers:
+            return self.check_etag_header()
+
+        since = self.request.headers.get("If-Modified-Since")
+        if since:
+            since = email.utils.parsedate_tz(since)
+            return since is not None and calendar.timegm(modified.utctimetuple()) <= email.utils.mktime_tz(since)
+        return False
+
+    @coroutine
+    def get(self, login, format_):
+        feed = yield self.thread_pool.submit(
+            self.db.fetch, "SELECT * FROM feeds WHERE login = ? AND is_enabled = TRUE", login)
+        if not feed:
+            raise HTTPError(404)
+
+        # rendered feed is cached until files or settings of the feed owner change its version
+        cache_key = (login, format_, self.hostname)
+        entry = self.feeds.get(cache_key, feed["version"])
+        if entry is None:
+            entry = yield self.thread_pool.submit(self._render, feed, format_)
+            self.feeds.set(cache_key, entry, feed["version"])
+
+        if feed["password"] and not self.http_basic_auth(feed["login"], feed["password"]):
+            return  # request HTTP basic authentication to protect the feed
+
+        body, etag = entry["body"], entry["etag"]
+        content_type = ExportHandler.CONTENT_TYPES[format_]
+
+        callback = format_ == "json" and self.get_json_callback()
+        if callback:
+            body = "/**/%s(%s);" % (callback, body)
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            content_type = "text/javascript; charset=UTF-8"
+
+        self.set_header("Etag", etag)
+        self.set_header("Last-Modified", entry["modified"])
+        if self._is_not_modified(entry["modified"]):
+            self.set_status(304)
+            return
+
+        self.set_header("Content-Type", content_type)
+        self.write(body)
@@ -22,8 +22,6 @@
 
 from __future__ import absolute_import, division, print_function, with_statement
 
-import utils
-
 from tornado.web import addslash, authenticated
 from tornado.gen import coroutine
 
@@ -53,7 +51,8 @@ class LoginHandler(BaseHandler):
 
         user = yield self.thread_pool.submit(
             self.db.fetch, "SELECT * FROM users WHERE login = ? AND is_enabled = TRUE", _login)
-        if not user or utils.hash_password(_password, user["password"]) != user["password"]:
+        is_valid = user and (yield self.check_password(_password, user["password"]))
+        if not is_valid:
             self.set_flash("The details you entered are incorrect.", BaseHandler.FLASH_ERROR)
             self.redirect(self.reverse_url("web_login") + "?login=" + _login)
             return
@@ -22,20 +22,35 @@
 
 from __future__ import absolute_import, division, print_function, with_statement
 
+import sys
+import signal
 import os.path
+import logging
 
 from tornado import gen
 from tornado.ioloop import IOLoop
 from tornado.options import define, options, parse_command_line
 from tornado.web import Application as BaseApplication
 from concurrent.futures import ThreadPoolExecutor
-from pydbal.threading import SafeConnection
 from pydbal.connection import Connection
 from ConfigParser import ConfigParser
 from ast import literal_eval
 
-from utils import ui_methods
+from utils import ui_methods, hash_file, chunks
 from utils.s3 import S3
+from utils.storage import Storage
+from utils.filesystem import FileSystem
+from utils.pool import ConnectionPool
+from utils.cache import SessionTracker, FeedCache, FileCache
+from utils.executor import ProcessPool
+from utils.stats import StatsBuffer, rebuild_counters
+from utils.sweeper import Sweeper
+from utils.scheduler import ExpiryScheduler
+from utils.jobs import JobQueue, JobWorker
+from utils.blobs import BlobStore
+from utils.metadata import Metadata
+from utils.png import thumbnails
+from utils import search
 
 from handlers import *
 from handlers import route
@@ -50,22 +65,79 @@ _config_defaults = dict(
         driver="mysql",
         host="localhost",
     ),
+    pool=dict(
+        min_size=1,
+        max_size=8,
+        timeout=10,
+        ping_interval=60,
+    ),
     session=dict(
         lifetime=600,
+        flush_interval=30,
+    ),
+    storage=dict(
+        backend="s3",
     ),
     s3=dict(
         download_url_lifetime=60,
+        download_url_margin=10,
+        download_url_cache_size=1024,
         storage_lifetime=864000,
+        endpoint_url=None,
+        max_pool_connections=None,
+        multipart_threshold=8 * 1024 ** 2,
+        multipart_chunksize=8 * 1024 ** 2,
+        max_concurrency=10,
+    ),
+    filesystem=dict(
+        root="/var/lib/sharedown/storage",
+        accel_redirect=None,
+        download_url_lifetime=60,
+        storage_lifetime=864000,
+    ),
+    upload=dict(
+        max_body_size=4 * 1024 ** 3,
+        part_size=8 * 1024 ** 2,
+        max_pending_parts=2,
+        lifetime=86400,
+        direct_url_lifetime=3600,
+    ),
+    stats=dict(
+        buffer_size=10000,
+        flush_size=500,
+        flush_interval=5,
+    ),
+    feed=dict(
+        cache_size=1024,
+        cache_ttl=300,
+    ),
+    download=dict(
+        cache_size=10000,
+        cache_ttl=30,
+    ),
+    jobs=dict(
+        workers=2,
+        poll_interval=5,
+        lease_time=300,
+        max_runtime=1800,
+        max_attempts=5,
+        retry_delay=30,
+        retention=604800,
     ),
     cron=dict(
         interval=900,
+        batch_size=1000,
     )
 )
 
 define("port", type=int, default=8000, help="Sharedown server port")
 define("debug", type=bool, default=False, help="Start in debug mode")
 define("max_workers", type=int, default=4, help="Thread pool max workers")
+define("cpu_workers", type=int, default=2, help="Process pool max workers for CPU-bound tasks")
+define("cpu_max_pending", type=int, default=32, help="Process pool max pending tasks")
 define("config", type=str, default="sharedown.conf", help="Path to config file")
+define("rebuild_counters", type=bool, default=False, help="Rebuild file download counters and exit")
+define("rebuild_search", type=bool, default=False, help="Rebuild file search index and exit")
 
 for _option, _defaults in _config_defaults.items():
     define(_option, type=dict, default=_defaults, help="%s configuration" % _option.capitalize())
@@ -84,20 +156,55 @@ class Application(BaseApplication):
                 options[option][key] = literal_eval(value)
 
         self.thread_pool = ThreadPoolExecutor(options.max_workers)
+        self.process_pool = ProcessPool(options.cpu_workers, options.cpu_max_pending)
 
         db_logger = Connection.get_default_logger()
         db_logger.propagate = False
 
-        self.database = SafeConnection(logger=db_logger, **options.pydbal)
+        self.database = ConnectionPool(dict(options.pydbal, logger=db_logger), **options.pool)
+
+        self.sessions = SessionTracker()
+
+        self.feeds = FeedCache(options.feed["cache_size"], options.feed["cache_ttl"])
+
+        self.file_cache = FileCache(options.download["cache_size"], options.download["cache_ttl"])
+
+        self.stats = StatsBuffer(options.stats["buffer_size"], options.stats["flush_size"])
 
-        self.s3 = S3(**options.s3)
+        cookie_secret = "*** PLEASE UPDATE THIS SECRET KEY ***"
 
+        if options.storage["backend"] == "filesystem":
+            self.storage = FileSystem(secret=cookie_secret, **options.filesystem)
+        elif options.storage["backend"] == "s3":
+            # every worker may run a transfer or a part upload, the transfer manager adds its own threads
+            if not options.s3["max_pool_connections"]:
+                options.s3["max_pool_connections"] = options.max_workers + options.s3["max_concurrency"]
+            self.storage = S3(**options.s3)
+        else:
+            raise ValueError("Unknown storage backend: %s" % options.storage["backend"])
+        self.sweeper = Sweeper(self.database, self.storage, options.cron["batch_size"])
+        self.expiry = ExpiryScheduler(
+            lambda keys: IOLoop.current().spawn_callback(_sweep, self, keys), options.cron["interval"] * 2)
+
+        self.blobs = BlobStore(self.database)
+
+        self.jobs = JobQueue(
+            self.database, options.jobs["lease_time"], options.jobs["max_attempts"], options.jobs["retry_delay"])
+        self.worker = JobWorker(self.jobs, self.thread_pool, options.jobs["workers"], options.jobs["poll_interval"],
+                                options.jobs["max_runtime"])
+        self.worker.register("metadata", lambda job: _extract_metadata(self, job))
+        self.worker.register("checksum", lambda job: _compute_checksum(self, job))
+        self.worker.register("delete", lambda job: _delete_files(self, job))
+
+        IOLoop.current().spawn_callback(self.worker.run)
         IOLoop.current().spawn_callback(_cron, self)
+        IOLoop.current().spawn_callback(_periodic, self, self.flush_sessions, options.session["flush_interval"])
+        IOLoop.current().spawn_callback(_periodic, self, self.flush_stats, options.stats["flush_interval"])
 
         super(Application, self).__init__(
             route.routes,
             login_url="/web/login",
-            cookie_secret="*** PLEASE UPDATE THIS SECRET KEY ***",
+            cookie_secret=cookie_secret,
             template_path=os.path.join(__dir__, "templates"),
             static_path=os.path.join(__dir__, "static"),
             ui_methods=ui_methods,
@@ -105,24 +212,186 @@ class Application(BaseApplication):
             gzip=True
         )
 
+    def flush_sessions(self):
+        # extend all sessions used since the last flush in one statement
+        sessions = self.sessions.pop_touched()
+        if sessions:
+            self.database.execute(
+                "UPDATE sess SET expires_at = NOW() + INTERVAL %d SECOND WHERE session IN (?) "
+                "AND expires_at IS NOT NULL" % options.session["lifetime"], list(sessions))
+
+    def flush_stats(self):
+        self.stats.flush(self.database)
+
+    def flush(self):
+        self.flush_stats()
+        self.flush_sessions()
+
+
+def _get_file(app, key):
+    return app.database.fetch(
+        "SELECT f.`key`, f.name, f.size, f.sha256, b.object FROM files f "
+        "LEFT JOIN blobs b ON b.sha256 = f.sha256 WHERE f.`key` = ?", key)
+
+
+def _extract_metadata(app, job):
+    key, name, size = job["key"], job["payload"]["name"], job["payload"]["size"]
+
+    # the object is looked up on every attempt, as the file may have been attached to a blob in the meantime
+    file_ = _get_file(app, key)
+    if not file_:
+        return None
+
+    # only the parts of the archive needed for metadata are fetched back, storage errors are retried by the queue
+    with app.storage.open(Storage.object_key(file_), size) as f:
+        metadata = Metadata(f, os.path.splitext(name)[1], max(Storage.ICON_SIZES))
+
+    icons = {}
+    if metadata.icon is not None:
+        try:
+            icons = app.process_pool.submit(thumbnails, metadata.icon, Storage.ICON_SIZES).result()
+        except StandardError as e:
+            logging.warning("Failed to read icon of %s: %s", key, e)
+        for icon_size, icon in icons.iteritems():
+            app.storage.put_object(
+                icon, Storage.icon_key(key, icon_size), "image/png", cache_control=Storage.ICON_CACHE_CONTROL)
+
+    def callback(conn):
+        # the file may have been deleted in the meantime
+        if not conn.query("SELECT `key` FROM files WHERE `key` = ? FOR UPDATE", key).fetch():
+            return False
+        for attribute, value in metadata.iteritems():
+            conn.execute(
+                "INSERT INTO meta (`key`, attribute, value) VALUES (?) ON DUPLICATE KEY UPDATE value = VALUES(value)",
+                (key, attribute, value))
+        if icons:
+            conn.execute("UPDATE files SET has_icon = TRUE WHERE `key` = ?", key)
+        # the document indexed on upload is rebuilt with the metadata values, so retries do not repeat them
+        search.reindex(conn, (key, ))
+        return True
+
+    if not app.database.transaction(callback) and icons:
+        app.storage.delete_many(Storage.icon_keys(key))
+    app.file_cache.invalidate((key, ))
+    return dict(metadata, icon=bool(icons))
+
+
+def _compute_checksum(app, job):
+    key = job["key"]
+
+    file_ = _get_file(app, key)
+    if not file_ or file_["sha256"]:
+        return None
+
+    object_key = Storage.object_key(file_)
+    with app.storage.open(object_key, file_["size"], 8 * 1024 ** 2) as f:
+        sha256 = hash_file(f)
+
+    # the same content has been stored before, so the own copy is not needed anymore
+    blob_key = app.blobs.attach(key, sha256, object_key, file_["size"])
+    if blob_key is not None and blob_key != object_key:
+        app.file_cache.invalidate((key, ))
+        app.storage.delete(object_key)
+    return {"sha256": sha256, "deduplicated": blob_key is not None and blob_key != object_key}
+
+
+def _delete_files(app, job):
+    # deleted keys are saved after every chunk, as files deleted by previous attempts are not found anymore
+    deleted, failed = (job["result"] or {}).get("deleted", []), []
+    pending = set(job["payload"]["keys"]).difference(deleted)
+    for keys in chunks(sorted(pending), options.cron["batch_size"]):
+        files = app.sweeper.fetch(keys, job["payload"]["login"])
+        _deleted = app.sweeper.delete(files)
+        _keys = set(x["key"] for x in _deleted)
+        app.file_cache.invalidate(_keys)
+        deleted.extend(_keys)
+        failed.extend(x["key"] for x in files if x["key"] not in _keys)
+        app.jobs.save_result(job, {"deleted": deleted, "failed": failed})
+    return {"deleted": deleted, "failed": failed}
+
 
 @gen.coroutine
-def _cron(app):
-    def task():
-        # clear expired sessions
-        app.database.execute("DELETE FROM sess WHERE expires_at < NOW()")
+def _sweep(app, keys=None):
+    # every batch is a separate task, so the shared thread pool is never blocked for long
+    after = ""
+    while True:
+        files = yield app.thread_pool.submit(app.sweeper.fetch_expired, after, keys)
+        if not files:
+            break
+        deleted = yield app.thread_pool.submit(app.sweeper.delete, files)
+        app.file_cache.invalidate([file_["key"] for file_ in deleted])
+        after = files[-1]["key"]
 
-        # remove expired files
-        for file_ in app.database.query("SELECT `key`, name FROM files WHERE expires_at < NOW()"):
-            app.database.execute("DELETE FROM files WHERE `key` = ?", file_["key"])
-            app.s3.delete("%s/%s" % (file_["key"], file_["name"]))
 
+@gen.coroutine
+def _cron(app):
     while True:
         interval = gen.sleep(options.cron["interval"])
-        yield app.thread_pool.submit(task)
+        try:
+            # clear expired sessions
+            yield app.thread_pool.submit(app.database.execute, "DELETE FROM sess WHERE expires_at < NOW()")
+
+            # schedule files expiring before the next run
+            files = yield app.thread_pool.submit(app.sweeper.fetch_upcoming, options.cron["interval"] * 2)
+            app.expiry.load(files)
+
+            # remove expired files the scheduler has missed
+            yield _sweep(app)
+
+            # abort resumable uploads abandoned by clients
+            after = ""
+            while True:
+                uploads = yield app.thread_pool.submit(app.sweeper.fetch_abandoned, options.upload["lifetime"], after)
+                if not uploads:
+                    break
+                yield app.thread_pool.submit(app.sweeper.abort_uploads, uploads)
+                after = uploads[-1]["key"]
+
+            # remove finished jobs
+            yield app.thread_pool.submit(app.jobs.purge, options.jobs["retention"])
+        except Exception as e:
+            logging.error(e)
         yield interval
 
+
+@gen.coroutine
+def _periodic(app, task, interval):
+    while True:
+        yield gen.sleep(interval)
+        try:
+            yield app.thread_pool.submit(task)
+        except Exception as e:
+            logging.error(e)
+
+
+@gen.coroutine
+def _shutdown(app, server):
+    # stop accepting connections and write out buffered data before exit
+    server.stop()
+    try:
+        yield app.thread_pool.submit(app.flush)
+    finally:
+        IOLoop.current().stop()
+
 if __name__ == "__main__":
     parse_command_line()
-    Application().listen(options.port)
+    application = Application()
+    if options.rebuild_counters or options.rebuild_search:
+        if options.rebuild_counters:
+            application.flush_stats()
+            rebuild_counters(application.database)
+        if options.rebuild_search:
+            search.rebuild(application.database)
+        sys.exit()
+
+    http_server = application.listen(options.port)
+
+    def _signal_handler(*_):
+        IOLoop.instance().add_callback_from_signal(_shutdown, application, http_server)
+
+    signal.signal(signal.SIGINT, _signal_handler)
+    signal.signal(signal.SIGTERM, _signal_handler)
+
     IOLoop.instance().start()
+    application.worker.shutdown(False)
+    application.process_pool.shutdown()
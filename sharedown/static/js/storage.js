@@ -57,6 +57,9 @@
             $storageEmpty = $storageList.find('.storage-empty').detach(),
 
             apiStorage = $storageList.data('api'),
+            apiUploads = $uploadForm.data('api'),
+            uploadParallel = 4,
+            uploadRetries = 3,
             login = _sharedown.get_login();
 
         this.format = function(integer) {
@@ -99,6 +102,98 @@
             $uploadModal.modal('hide');
         };
 
+        this.uploadFile = function(file, headers, progress) {
+            var defer = $.Deferred();
+
+            // resumable upload: the file is sent in parts, several at once, and failed parts are retried
+            $.ajax(apiUploads, {
+                type: 'POST',
+                headers: $.extend({ 'X-SF-Size': file.size, 'X-SF-Content-Type': file.type }, headers),
+                global: false
+            }).done(function(upload) {
+                // the same content has been uploaded before, so the file is already created
+                if (upload.deduplicated) {
+                    progress(file.size);
+                    return defer.resolve(upload);
+                }
+
+                var url = apiUploads + '/' + upload.key,
+                    numbers = [],
+                    loaded = {},
+                    pending = 0;
+
+                for (var i = upload.parts; i > 0; i--)
+                    numbers.push(i);
+
+                var fail = function() {
+                    if (defer.state() !== 'pending')
+                        return;
+
+                    defer.reject();
+                    $.ajax(url, { type: 'DELETE', global: false });
+                };
+
+                var send = function(number, retries) {
+                    var start = (number - 1) * upload.part_size,
+                        blob = file.slice(start, start + upload.part_size);
+
+                    $.ajax(url + '/' + number, {
+                        type: 'PUT',
+                        data: blob,
+                        global: false,
+                        processData: false,
+                        contentType: 'application/octet-stream',
+                        xhr: function() {
+                            var xhr = $.ajaxSettings.xhr();
+                            xhr.upload.onprogress = function(e) {
+                                if (abort)
+                                    return xhr.abort();
+
+                                loaded[number] = e.loaded;
+                                progress(Object.keys(loaded).reduce(function(sum, n) {
+                                    return sum + loaded[n];
+                                }, 0));
+                            };
+                            return xhr;
+                        }
+                    }).done(function() {
+                        loaded[number] = blob.size;
+                        pending--;
+                        next();
+                    }).fail(function() {
+                        loaded[number] = 0;
+                        if (abort || retries >= uploadRetries)
+                            return fail();
+
+                        setTimeout(function() {
+                            send(number, retries + 1);
+                        }, 1000 << retries);
+                    });
+                };
+
+                var next = function() {
+                    if (defer.state() !== 'pending')
+                        return;
+
+                    if (abort)
+                        return fail();
+
+                    if (numbers.length) {
+                        pending++;
+                        return send(numbers.pop(), 0);
+                    }
+
+                    if (!pending)
+                        $.ajax(url, { type: 'POST', global: false }).done(defer.resolve).fail(fail);
+                };
+
+                for (i = 0; i < uploadParallel; i++)
+                    next();
+            }).fail(defer.reject);
+
+            return defer.promise();
+        };
+
         this.loadStorage = function() {
             $.getJSON(apiStorage + window.location.search).done(function(data) {
                 if (!data.files || !Array.isArray(data.files))
@@ -138,6 +233,9 @@
                             .find('.storage-public')
                                 .attr('title', (item.is_public ? 'A' : 'Una') + 'vailable in feed')
                                 .toggleClass('text-muted-2', !item.is_public).end()
+                            .find('.storage-icon')
+                                .attr('src', item.has_icon ? '/dl/' + item.key + '/icon-48.png' : null)
+                                .toggleClass('hidden', !item.has_icon).end()
                             .find('.storage-name')
                                 .text(item.name)
                                 .attr({ title: item.caption || item.name, href: '/dl/' + item.key })
@@ -259,53 +357,34 @@
                 var $item = $uploadList.children(':has(:hidden[value=' + index + '])'),
                     file = files[index];
 
-                defers.push($.ajax({
-                    type: 'PUT',
-                    data: file,
-                    url: $uploadForm.prop('action'),
-                    headers: {
-                        'X-SF-Name': file.name,
-                        'X-SF-Folder': data._folder,
-                        'X-SF-Caption': data._caption,
-                        'X-SF-Password': data._password,
-                        'X-SF-Permanent': data._permanent,
-                        'X-SF-Public': data._public
-                    },
-                    global: false,
-                    processData: false,
-                    contentType: false,
-                    xhr: function() {
-                        var xhr = $.ajaxSettings.xhr();
-                        xhr.upload.onprogress = function(e) {
-                            if (abort)
-                                xhr.abort();
-
-                            if (!e.lengthComputable)
-                                return;
-
-                            var now = +new Date();
-                            if (now - ltime < 100)
-                                return /* Safari sleep */;
-
-                            var csize = loaded + e.loaded,
-                                progress = csize / size * 100;
-
-                            $item.addClass('upload');
-                            $uploadProgressBar.css('width', progress + '%').text(Math.round(progress) + '%');
-                            $uploadSize.text(_self.size(csize) + ' / ' + fsize);
-
-                            if (progress < 100) {
-                                var ctime = now - time,
-                                    tms = ctime / csize * (size - csize);
-
-                                $uploadSpeed.text(_self.size(csize / ctime * 1e3) + '/s ~ ' + _self.time(tms));
-                            } else
-                                $uploadSpeed.text('Processing files, please wait...');
-
-                            ltime = now;
-                        };
-                        return xhr;
-                    }
+                defers.push(_self.uploadFile(file, {
+                    'X-SF-Name': file.name,
+                    'X-SF-Folder': data._folder,
+                    'X-SF-Caption': data._caption,
+                    'X-SF-Password': data._password,
+                    'X-SF-Permanent': data._permanent,
+                    'X-SF-Public': data._public
+                }, function(floaded) {
+                    var now = +new Date();
+                    if (now - ltime < 100)
+                        return /* Safari sleep */;
+
+                    var csize = loaded + floaded,
+                        progress = csize / size * 100;
+
+                    $item.addClass('upload');
+                    $uploadProgressBar.css('width', progress + '%').text(Math.round(progress) + '%');
+                    $uploadSize.text(_self.size(csize) + ' / ' + fsize);
+
+                    if (progress < 100) {
+                        var ctime = now - time,
+                            tms = ctime / csize * (size - csize);
+
+                        $uploadSpeed.text(_self.size(csize / ctime * 1e3) + '/s ~ ' + _self.time(tms));
+                    } else
+                        $uploadSpeed.text('Processing files, please wait...');
+
+                    ltime = now;
                 }).done(function() {
                     loaded += file.size;
                     $item.removeClass('upload').addClass('done text-success');
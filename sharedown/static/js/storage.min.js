@@ -5,4 +5,4 @@
  * @email   alex.lokhman@gmail.com
  * @link    https://github.com/lokhman/sharedown
  */
-(function(a,b){a.Sharedown.Storage=new function(){var v=a.Sharedown,k=this;if("Storage" in v){return v.Storage}if(typeof a.FileReader==="undefined"){return v.modal("Browser","Your browser is not supported here.")}var h=0,x=[],L=[],p=false,m=b(".drop-zone"),z=b("#modal_edit"),t=z.find("form"),u=b("#_edit_public"),f=b("#_edit_folder"),G=b("#_edit_caption"),D=b("#_edit_password"),j=b("#_edit_permanent"),J=z.find(".modal-title"),q=b("#modal_upload"),E=q.find("form"),r=b("#_upload_public"),c=b("#_upload_folder"),A=b("#_upload_caption"),o=b("#_upload_password"),I=b("#_upload_permanent"),F=q.find(":submit"),s=q.find(".upload-list"),y=s.find(".upload-item").detach(),n=q.find(".upload-progress"),e=n.find(".progress-bar"),K=n.find(".upload-speed"),i=n.find(".upload-size"),g=b(".storage-upload"),M=b(".storage-list"),H=b(".storage-total"),w=M.find(".storage-folder").show().detach(),d=M.find(".storage-item").show().detach(),l=M.find(".storage-empty").detach(),B=M.data("api"),C=v.get_login();this.format=function(N){return(N+"").replace(/(\d)(?=(\d{3})+$)/g,"$1,")};this.size=function(N){if(!N){return"0 bytes"}var O=Math.log(N)/Math.log(1024)|0;return +(N/Math.pow(1024,O)).toFixed(2)+" "+["bytes","KB","MB","GB","TB"][O]};this.time=function(N){return new Date(N).toTimeString().split(" ")[0]};this.serialize=function(N){return N.reduce(function(P,O){if(O.name in P){if(!Array.isArray(P[O.name])){P[O.name]=[P[O.name]]}P[O.name].push(O.value)}else{P[O.name]=O.value}return P},{})};this.random_bytes=function(N){for(var O="";N>0;N-=8){O+=Math.random().toString(36).slice(-Math.min(N,8))}return O};this.hideModalUpload=function(){p=true;q.modal("hide")};this.loadStorage=function(){b.getJSON(B+a.location.search).done(function(O){if(!O.files||!Array.isArray(O.files)){return}M.empty();if(O.files.length===0){return l.appendTo(M)}var N=O.files.reduce(function(R,P){var Q=P.folder||"";if(P.login!==C){Q="{"+P.login+"} "+Q}Q=Q.trim();if(!(Q in R)){R[Q]=[]}R[Q].push(P);return R},{});L.length=0;L.push.apply(L,Object.keys(N).sort());b.each(L,function(P,Q){Q&&w.clone().find("div").html(function(){return Q.replace(/^{([^}]+)}/,'<a href="?login=$1"><mark>$1</mark></a>')}).end().appendTo(M);b.each(N[Q],function(R,S){d.clone().find(".storage-lock").attr("title",S.password?"Password protected":"Unprotected").toggleClass("text-muted-2",!S.password).end().find(".storage-public").attr("title",(S.is_public?"A":"Una")+"vailable in feed").toggleClass("text-muted-2",!S.is_public).end().find(".storage-name").text(S.name).attr({title:S.caption||S.name,href:"/dl/"+S.key}).on("click",function(){if(a.prompt("The URL for sharing:",this.href)!==this.href){return false}}).end().find(".storage-size").text(k.size(S.size)).attr("title",k.format(S.size)+" bytes").end().find(".storage-created").text(S.created_at).attr("title","Expires at: "+(S.expires_at||"(never)")+"<br>Downloaded "+(S.downloads===1?"once":S.downloads+" times")).toggleClass("text-danger",!S.expires_at).tooltip({html:true}).end().find("[title]").tooltip().end().attr("data-key",S.key).appendTo(M)})})}).always(function(){H.text("Total: "+b(".storage-item").length)})};c.add(f).typeahead({source:L});M.on("click",".status-info",function(){var N=b(this).closest(".storage-item").data("key");b.getJSON(B+"/"+N).done(function(O){v.modal(O.name,'<dl class="dl-horizontal"><dt>Key:</dt><dd>'+O.key+"</dd><dt>Name:</dt><dd>"+O.name+'</dd><dt>Size:</dt><dd><abbr title="'+k.format(O.size)+' bytes">'+k.size(O.size)+"</abbr></dd><dt>User:</dt><dd>"+(O.login||"<s>deleted</s>")+"</dd><dt>Folder:</dt><dd>"+(O.folder||"<s>default</s>")+"</dd><dt>Caption:</dt><dd>"+(O.caption||"<s>no caption</s>")+'</dd><dt>Password:</dt><dd class="text-danger">'+(O.password||"<s>no password</s>")+"</dd><dt>Feed status:</dt><dd>"+(O.is_public?"displayed":"hidden")+"</dd><dt>MIME type:</dt><dd>"+O.mimetype+"</dd><dt>Created at:</dt><dd>"+O.created_at+"</dd><dt>Expires at:</dt><dd>"+(O.expires_at||"<s>never</s>")+'</dd><dt>Downloads:</dt><dd style="margin-bottom: 10px;">'+O.downloads+"</dd>"+Object.keys(O.metadata).sort().map(function(P){return"<dt>["+P+"]:</dt><dd>"+O.metadata[P]+"</dd>"}).join("")+"</dl>")})});M.on("click",".storage-delete",function(){var N=b(this).closest(".storage-item").data("key");v.modal("Delete","Do you want to delete this file?",function(){v.ajax_start();b.ajax(B+"/"+N,{type:"DELETE",global:false}).done(k.loadStorage).fail(function(){setTimeout(function(){v.modal("Error","Failed to delete the item from the storage.")},500)}).always(v.ajax_stop)})});q.on({"show.bs.modal":function(){if(!x.length){return}h=0;p=false;s.empty();for(var P=0,N=x.length;P<N;P++){var O=x[P];h+=O.size;y.clone().attr("data-text",O.name+" ["+k.size(O.size)+"]").find(":hidden").val(P).end().appendTo(s)}I.add(r).prop({disabled:false,checked:false});o.prop("disabled",false).val(k.random_bytes(8));A.prop("disabled",x.length!==1).val("");c.prop("disabled",false).val("");F.prop("disabled",false);e.css("width",0);n.hide()},"hide.bs.modal":function(){if(!p){return v.modal("Cancel","Are you sure that you want to cancel the upload?",k.hideModalUpload)}x=[]}});E.on("submit",function(){var R=k.serialize(E.serializeArray()),Q=R["_upload_files[]"],O=k.size(h),P=+new Date(),N=0,S=0,U=[],T=[],V=0;if(!Array.isArray(Q)){Q=[Q]}b.each(Q,function(Z,X){var W=s.children(":has(:hidden[value="+X+"])"),Y=x[X];U.push(b.ajax({type:"PUT",data:Y,url:E.prop("action"),headers:{"X-SF-Name":Y.name,"X-SF-Folder":R._folder,"X-SF-Caption":R._caption,"X-SF-Password":R._password,"X-SF-Permanent":R._permanent,"X-SF-Public":R._public},global:false,processData:false,contentType:false,xhr:function(){var aa=b.ajaxSettings.xhr();aa.upload.onprogress=function(ag){if(p){aa.abort()}if(!ag.lengthComputable){return}var ad=+new Date();if(ad-V<100){return}var ae=S+ag.loaded,ac=ae/h*100;W.addClass("upload");e.css("width",ac+"%").text(Math.round(ac)+"%");i.text(k.size(ae)+" / "+O);if(ac<100){var af=ad-P,ab=af/ae*(h-ae);K.text(k.size(ae/af*1000)+"/s ~ "+k.time(ab))}else{K.text("Processing files, please wait...")}V=ad};return aa}}).done(function(){S+=Y.size;W.removeClass("upload").addClass("done text-success")}).fail(function(){T.push(Y.name);W.removeClass("upload").addClass("error text-danger")}).always(function(){if(++N<U.length||!T.length){return}if(!p){v.modal("Error",'The following files failed to upload:<ul class="text-danger"><li>'+T.join("</li><li>")+"</li></ul>Please try again later.")}k.hideModalUpload();if(T.length<U.length){k.loadStorage()}}))});o.add(r).add(c).add(A).add(I).prop("disabled",true);n.show();b.when.apply(b,U).done(function(){k.hideModalUpload();k.loadStorage()});return false});s.on("click",".close",function(){if(s.children().length>1){b(this.parentNode).remove()}return false});b("html").has(m).on("dragenter",function(){m.show()});m.on({dragover:function(){return false},dragleave:function(){m.hide()},drop:function(N){m.hide();if(x.length){return false}b.when.apply(b,b.map(N.originalEvent.dataTransfer.files,function(P){var Q=b.Deferred(),O;if(P.size===0){Q.resolve()}else{if(P.size<1048576){O=new FileReader();O.onload=function(){x.push(P);Q.resolve()};O.onerror=function(){Q.resolve()};O.readAsDataURL(P)}else{x.push(P);Q.resolve()}}return Q.promise()})).done(function(){x.length&&q.modal()});return false}});g.on("change",function(){x=[];for(var P=0,N=this.files.length;P<N;P++){var O=this.files[P];if(O.size){x.push(O)}}x.length&&q.modal();this.value=""});z.on({"show.bs.modal":function(Q){var P=b(Q.relatedTarget),R=P.closest("[data-key]"),N=R.find(".storage-name").text(),O=R.data("key");t.prop({action:B+"/"+O,method:"PATCH"}).data("message",'File "'+N+'" was successfully updated.');J.text(N);v.form_dynamic(t[0],function(){z.modal("hide");k.loadStorage()})},"hide.bs.modal":function(){D.add(G).add(f).val("").trigger("keyup");j.add(u).prop("checked",false)}});b(this.loadStorage)}})(window,jQuery);
\ No newline at end of file
+(function(b,a){'use strict';b.Sharedown.Storage=new function(){var e=b.Sharedown,c=this;if('Storage'in e)return e.Storage;if(typeof b.FileReader==='undefined')return e.modal('Browser','Your browser is not supported here.');var j=0,d=[],k=[],h=false,m=a('.drop-zone'),o=a('#modal_edit'),y=o.find('form'),M=a('#_edit_public'),z=a('#_edit_folder'),P=a('#_edit_caption'),O=a('#_edit_password'),N=a('#_edit_permanent'),L=o.find('.modal-title'),g=a('#modal_upload'),p=g.find('form'),t=a('#_upload_public'),q=a('#_upload_folder'),x=a('#_upload_caption'),w=a('#_upload_password'),v=a('#_upload_permanent'),D=g.find(':submit'),i=g.find('.upload-list'),F=i.find('.upload-item').detach(),l=g.find('.upload-progress'),u=l.find('.progress-bar'),s=l.find('.upload-speed'),E=l.find('.upload-size'),G=a('.storage-upload'),f=a('.storage-list'),H=a('.storage-total'),J=f.find('.storage-folder').show().detach(),I=f.find('.storage-item').show().detach(),K=f.find('.storage-empty').detach(),n=f.data('api'),r=p.data('api'),B=4,A=3,C=e.get_login();this.format=function(a){return(a+'').replace(/(\d)(?=(\d{3})+$)/g,'$1,');};this.size=function(a){if(!a)return'0 bytes';var b=Math.log(a)/Math.log(1024)|0;return+(a/Math.pow(1024,b)).toFixed(2)+' '+['bytes','KB','MB','GB','TB'][b];};this.time=function(a){return new Date(a).toTimeString().split(' ')[0];};this.serialize=function(a){return a.reduce(function(b,a){if(a.name in b){if(!Array.isArray(b[a.name]))b[a.name]=[b[a.name]];b[a.name].push(a.value);}else b[a.name]=a.value;return b;},{});};this.random_bytes=function(a){for(var b='';a>0; a-=8)b+=Math.random().toString(36).slice(-Math.min(a,8));return b;};this.hideModalUpload=function(){h=true;g.modal('hide');};this.uploadFile=function(c,e,d){var b=a.Deferred();a.ajax(r,{type:'POST',headers:a.extend({'X-SF-Size':c.size,'X-SF-Content-Type':c.type},e),global:false}).done(function(e){if(e.deduplicated){d(c.size);return b.resolve(e);}var i=r+'/'+e.key,k=[],g={},j=0;for(var f=e.parts; f>0; f--)k.push(f);var l=function(){if(b.state()!=='pending')return;b.reject();a.ajax(i,{type:'DELETE',global:false});};var m=function(b,f){var k=(b-1)*e.part_size,o=c.slice(k,k+e.part_size);a.ajax(i+'/'+b,{type:'PUT',data:o,global:false,processData:false,contentType:'application/octet-stream',xhr:function(){var c=a.ajaxSettings.xhr();c.upload.onprogress=function(a){if(h)return c.abort();g[b]=a.loaded;d(Object.keys(g).reduce(function(a,b){return a+g[b];},0));};return c;}}).done(function(){g[b]=o.size;j--;n();}).fail(function(){g[b]=0;if(h||f>=A)return l();setTimeout(function(){m(b,f+1);},1000<<f);});};var n=function(){if(b.state()!=='pending')return;if(h)return l();if(k.length){j++;return m(k.pop(),0);}if(!j)a.ajax(i,{type:'POST',global:false}).done(b.resolve).fail(l);};for(f=0; f<B; f++)n();}).fail(b.reject);return b.promise();};this.loadStorage=function(){a.getJSON(n+b.location.search).done(function(d){if(!d.files||!Array.isArray(d.files))return;f.empty();if(d.files.length===0)return K.appendTo(f);var e=d.files.reduce(function(b,c){var a=c.folder||'';if(c.login!==C)a='{'+c.login+'} '+a;a=a.trim();if(!(a in b))b[a]=[];b[a].push(c);return b;},{});k.length=0;k.push.apply(k,Object.keys(e).sort());a.each(k,function(g,d){d&&J.clone().find('div').html(function(){return d.replace(/^{([^}]+)}/,'<a href="?login=$1"><mark>$1</mark></a>');}).end().appendTo(f);a.each(e[d],function(d,a){I.clone().find('.storage-lock').attr('title',a.password?'Password protected':'Unprotected').toggleClass('text-muted-2',!a.password).end().find('.storage-public').attr('title',(a.is_public?'A':'Una')+'vailable in feed').toggleClass('text-muted-2',!a.is_public).end().find('.storage-icon').attr('src',a.has_icon?'/dl/'+a.key+'/icon-48.png':null).toggleClass('hidden',!a.has_icon).end().find('.storage-name').text(a.name).attr({title:a.caption||a.name,href:'/dl/'+a.key}).on('click',function(){if(b.prompt('The URL for sharing:',this.href)!==this.href)return false;}).end().find('.storage-size').text(c.size(a.size)).attr('title',c.format(a.size)+' bytes').end().find('.storage-created').text(a.created_at).attr('title','Expires at: '+(a.expires_at||'(never)')+'<br>Downloaded '+(a.downloads===1?'once':a.downloads+' times')).toggleClass('text-danger',!a.expires_at).tooltip({html:true}).end().find('[title]').tooltip().end().attr('data-key',a.key).appendTo(f);});});}).always(function(){H.text('Total: '+a('.storage-item').length);});};q.add(z).typeahead({source:k});f.on('click','.status-info',function(){var b=a(this).closest('.storage-item').data('key');a.getJSON(n+'/'+b).done(function(a){e.modal(a.name,'<dl class="dl-horizontal">'+'<dt>Key:</dt><dd>'+a.key+'</dd>'+'<dt>Name:</dt><dd>'+a.name+'</dd>'+'<dt>Size:</dt><dd><abbr title="'+c.format(a.size)+' bytes">'+c.size(a.size)+'</abbr></dd>'+'<dt>User:</dt><dd>'+(a.login||'<s>deleted</s>')+'</dd>'+'<dt>Folder:</dt><dd>'+(a.folder||'<s>default</s>')+'</dd>'+'<dt>Caption:</dt><dd>'+(a.caption||'<s>no caption</s>')+'</dd>'+'<dt>Password:</dt><dd class="text-danger">'+(a.password||'<s>no password</s>')+'</dd>'+'<dt>Feed status:</dt><dd>'+(a.is_public?'displayed':'hidden')+'</dd>'+'<dt>MIME type:</dt><dd>'+a.mimetype+'</dd>'+'<dt>Created at:</dt><dd>'+a.created_at+'</dd>'+'<dt>Expires at:</dt><dd>'+(a.expires_at||'<s>never</s>')+'</dd>'+'<dt>Downloads:</dt><dd style="margin-bottom: 10px;">'+a.downloads+'</dd>'+Object.keys(a.metadata).sort().map(function(b){return'<dt>['+b+']:</dt><dd>'+a.metadata[b]+'</dd>';}).join('')+'</dl>');});});f.on('click','.storage-delete',function(){var b=a(this).closest('.storage-item').data('key');e.modal('Delete','Do you want to delete this file?',function(){e.ajax_start();a.ajax(n+'/'+b,{type:'DELETE',global:false}).done(c.loadStorage).fail(function(){setTimeout(function(){e.modal('Error','Failed to delete the item from the storage.');},500);}).always(e.ajax_stop);});});g.on({'show.bs.modal':function(){if(!d.length)return;j=0;h=false;i.empty();for(var a=0,e=d.length; a<e; a++){var b=d[a];j+=b.size;F.clone().attr('data-text',b.name+' ['+c.size(b.size)+']').find(':hidden').val(a).end().appendTo(i);}v.add(t).prop({disabled:false,checked:false});w.prop('disabled',false).val(c.random_bytes(8));x.prop('disabled',d.length!==1).val('');q.prop('disabled',false).val('');D.prop('disabled',false);u.css('width',0);l.hide();},'hide.bs.modal':function(){if(!h)return e.modal('Cancel','Are you sure that you want to cancel the upload?',c.hideModalUpload);d=[];}});p.on('submit',function(){var b=c.serialize(p.serializeArray()),k=b['_upload_files[]'],y=c.size(j),o=+new Date(),r=0,n=0,g=[],f=[],m=0;if(!Array.isArray(k))k=[k];a.each(k,function(p,l){var k=i.children(':has(:hidden[value='+l+'])'),a=d[l];g.push(c.uploadFile(a,{'X-SF-Name':a.name,'X-SF-Folder':b._folder,'X-SF-Caption':b._caption,'X-SF-Password':b._password,'X-SF-Permanent':b._permanent,'X-SF-Public':b._public},function(g){var d=+new Date();if(d-m<100)return;var a=n+g,b=a/j*100;k.addClass('upload');u.css('width',b+'%').text(Math.round(b)+'%');E.text(c.size(a)+' / '+y);if(b<100){var e=d-o,f=e/a*(j-a);s.text(c.size(a/e*1e3)+'/s ~ '+c.time(f));}else s.text('Processing files, please wait...');m=d;}).done(function(){n+=a.size;k.removeClass('upload').addClass('done text-success');}).fail(function(){f.push(a.name);k.removeClass('upload').addClass('error text-danger');}).always(function(){if(++r<g.length||!f.length)return;if(!h)e.modal('Error','The following files failed to upload:<ul class="text-danger"><li>'+f.join('</li><li>')+'</li></ul>Please try again later.');c.hideModalUpload();if(f.length<g.length)c.loadStorage();}));});w.add(t).add(q).add(x).add(v).prop('disabled',true);l.show();a.when.apply(a,g).done(function(){c.hideModalUpload();c.loadStorage();});return false;});i.on('click','.close',function(){if(i.children().length>1)a(this.parentNode).remove();return false;});a('html').has(m).on('dragenter',function(){m.show();});m.on({dragover:function(){return false;},dragleave:function(){m.hide();},drop:function(b){m.hide();if(d.length)return false;a.when.apply(a,a.map(b.originalEvent.dataTransfer.files,function(b){var c=a.Deferred(),e;if(b.size===0){c.resolve();}else if(b.size<1048576){e=new FileReader();e.onload=function(){d.push(b);c.resolve();};e.onerror=function(){c.resolve();};e.readAsDataURL(b);}else{d.push(b);c.resolve();}return c.promise();})).done(function(){d.length&&g.modal();});return false;}});G.on('change',function(){d=[];for(var a=0,c=this.files.length; a<c; a++){var b=this.files[a];if(b.size)d.push(b);}d.length&&g.modal();this.value='';});o.on({'show.bs.modal':function(g){var h=a(g.relatedTarget),d=h.closest('[data-key]'),b=d.find('.storage-name').text(),f=d.data('key');y.prop({action:n+'/'+f,method:'PATCH'}).data('message','File "'+b+'" was successfully updated.');L.text(b);e.form_dynamic(y[0],function(){o.modal('hide');c.loadStorage();});},'hide.bs.modal':function(){O.add(P).add(z).val('').trigger('keyup');N.add(M).prop('checked',false);}});a(this.loadStorage);};})(window,jQuery);
\ No newline at end of file
@@ -23,17 +23,21 @@
 from __future__ import absolute_import, division, print_function, with_statement
 
 import re
+import hmac
 import pytz
 import string
 import bcrypt
 import base64
+import hashlib
 import mimetypes
 import unicodedata
 
+from urllib import quote
 from datetime import datetime
 from random import SystemRandom
 from collections import Mapping, Sequence, Set
 from tornado.web import create_signed_value, decode_signed_value
+from tornado.escape import json_encode, json_decode
 
 
 _TOKENIZE_RANDOM_PADDING = 4
@@ -48,10 +52,25 @@ def hash_password(password, salt=None):
     return bcrypt.hashpw(password.encode("utf8"), salt.encode("utf8"))
 
 
+def check_password(password, hashed):
+    hashed = hashed.encode("utf8")
+    return hmac.compare_digest(bcrypt.hashpw(password.encode("utf8"), hashed), hashed)
+
+
 def random_bytes(length=32):
     return "".join(SystemRandom().choice(_STRING_ALPHANUM) for _ in range(length))
 
 
+def hash_file(file_, chunk_size=8 * 1024 ** 2):
+    if isinstance(file_, basestring):
+        with open(file_, "rb") as f:
+            return hash_file(f, chunk_size)
+    hash_ = hashlib.sha256()
+    for chunk in iter(lambda: file_.read(chunk_size), b""):
+        hash_.update(chunk)
+    return hash_.hexdigest()
+
+
 def tokenize_value(key, value):
     return base64.b64encode(random_bytes(_TOKENIZE_RANDOM_PADDING) + create_signed_value(key, "0", value))
 
@@ -63,6 +82,20 @@ def untokenize_value(key, token):
         return None
 
 
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json_encode(values))
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json_decode(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
 def underscore(word):
     return _RE_UNDERSCORE.sub(r"_\1", word).lower()
 
@@ -98,6 +131,23 @@ def normalize_chunk(chunk, sep=" "):
     return chunk
 
 
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def content_disposition(filename):
+    if isinstance(filename, unicode):
+        filename = filename.encode("utf-8")
+    return "attachment; filename*=UTF-8''%s" % quote(filename, "")
+
+
 def datetime_parse(dt_str):
     try:
         return datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import struct
+
+# chunk types, see frameworks/base/libs/androidfw/include/androidfw/ResourceTypes.h
+_RES_STRING_POOL_TYPE = 0x0001
+_RES_TABLE_TYPE = 0x0002
+_RES_XML_TYPE = 0x0003
+_RES_XML_START_ELEMENT_TYPE = 0x0102
+_RES_XML_RESOURCE_MAP_TYPE = 0x0180
+_RES_TABLE_PACKAGE_TYPE = 0x0200
+_RES_TABLE_TYPE_TYPE = 0x0201
+
+_UTF8_FLAG = 1 << 8
+_FLAG_SPARSE = 0x01
+_FLAG_OFFSET16 = 0x02
+_FLAG_COMPLEX = 0x0001
+_FLAG_COMPACT = 0x0008
+_NO_ENTRY = 0xFFFFFFFF
+
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+
+# framework attribute IDs, used when attribute names are stripped
+ATTRS = {
+    0x01010001: "label",
+    0x01010002: "icon",
+    0x0101020c: "minSdkVersion",
+    0x0101021b: "versionCode",
+    0x0101021c: "versionName",
+    0x01010270: "targetSdkVersion",
+}
+
+_MAX_REFERENCE_DEPTH = 8
+
+
+class AndroidError(ValueError):
+    pass
+
+
+def _chunks(data, start, end):
+    """Iterates over chunks between given offsets.
+
+    :return: chunk type, header size, chunk offset and size
+    :rtype: generator
+    """
+    while start + 8 <= end:
+        type_, header_size, size = struct.unpack_from("<2HL", data, start)
+        if size < 8 or header_size > size or start + size > end:
+            raise AndroidError("Invalid chunk at %d" % start)
+        yield type_, header_size, start, size
+        start += size
+
+
+class _StringPool:
+    def __init__(self, data, offset):
+        count, _, flags, strings_start = struct.unpack_from("<4L", data, offset + 8)
+        self._data = data
+        self._utf8 = flags & _UTF8_FLAG
+        self._strings = offset + strings_start
+        self._offsets = struct.unpack_from("<%dL" % count, data, offset + 28)
+
+    @staticmethod
+    def _length(data, offset, wide):
+        # lengths of long strings take two units with the high bit set in the first one
+        if wide:
+            length = struct.unpack_from("<H", data, offset)[0]
+            if length & 0x8000:
+                return (length & 0x7FFF) << 16 | struct.unpack_from("<H", data, offset + 2)[0], offset + 4
+            return length, offset + 2
+        length = ord(data[offset])
+        if length & 0x80:
+            return (length & 0x7F) << 8 | ord(data[offset + 1]), offset + 2
+        return length, offset + 1
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self._offsets):
+            return None
+        offset = self._strings + self._offsets[index]
+        if self._utf8:
+            _, offset = self._length(self._data, offset, False)
+            length, offset = self._length(self._data, offset, False)
+            return self._data[offset:offset + length].decode("utf8", "replace")
+        length, offset = self._length(self._data, offset, True)
+        return self._data[offset:offset + length * 2].decode("utf_16_le", "replace")
+
+
+class Value:
+    def __init__(self, type_, data, string=None):
+        self.type = type_
+        self.data = data
+        self.string = string
+
+    @property
+    def value(self):
+        if self.type == TYPE_STRING:
+            return self.string
+        elif self.type == TYPE_INT_BOOLEAN:
+            return self.data != 0
+        elif self.type in (TYPE_INT_DEC, TYPE_INT_HEX):
+            return self.data - (1 << 32) if self.data & 0x80000000 else self.data
+        return None
+
+
+def parse_manifest(data, elements=("manifest", "uses-sdk", "application")):
+    """Parses compiled AndroidManifest.xml up to the last of requested elements.
+
+    :param data: binary XML contents
+    :param elements: names of elements to collect attributes of
+    :return: attribute values by element name
+    :rtype: dict
+    """
+    if len(data) < 8 or struct.unpack_from("<H", data)[0] != _RES_XML_TYPE:
+        raise AndroidError("Invalid binary XML")
+
+    strings, resource_ids, result = None, (), {}
+    for type_, header_size, offset, size in _chunks(data, struct.unpack_from("<H", data, 2)[0], len(data)):
+        if type_ == _RES_STRING_POOL_TYPE:
+            strings = _StringPool(data, offset)
+        elif type_ == _RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = struct.unpack_from("<%dL" % ((size - header_size) // 4), data, offset + header_size)
+        elif type_ == _RES_XML_START_ELEMENT_TYPE:
+            if strings is None:
+                raise AndroidError("String pool not found")
+
+            ext = offset + header_size
+            name, attr_start, attr_size, attr_count = struct.unpack_from("<4x L 3H", data, ext)
+            name = strings[name]
+            if name not in elements or name in result:
+                continue
+
+            attributes = result[name] = {}
+            for i in range(attr_count):
+                _, attr, raw, value_type, value = struct.unpack_from(
+                    "<3L 3xB L", data, ext + attr_start + i * attr_size)
+                if attr < len(resource_ids) and resource_ids[attr] in ATTRS:
+                    attr = ATTRS[resource_ids[attr]]
+                else:
+                    attr = strings[attr]
+                if raw != _NO_ENTRY:
+                    attributes[attr] = Value(TYPE_STRING, raw, strings[raw])
+                else:
+                    attributes[attr] = Value(value_type, value, strings[value] if value_type == TYPE_STRING else None)
+
+            if len(result) == len(elements):
+                break
+    return result
+
+
+class ResourceTable:
+    def __init__(self, data):
+        """Reads compiled resources table (resources.arsc). Only chunk headers are parsed upfront.
+
+        :param data: table contents
+        """
+        if len(data) < 12 or struct.unpack_from("<H", data)[0] != _RES_TABLE_TYPE:
+            raise AndroidError("Invalid resources table")
+
+        self._data = data
+        self._strings = None
+        self._packages = {}
+
+        for type_, header_size, offset, size in _chunks(data, struct.unpack_from("<H", data, 2)[0], len(data)):
+            if type_ == _RES_STRING_POOL_TYPE and self._strings is None:
+                self._strings = _StringPool(data, offset)
+            elif type_ == _RES_TABLE_PACKAGE_TYPE:
+                package_id = struct.unpack_from("<L", data, offset + 8)[0]
+                types = self._packages[package_id] = {}
+                for chunk in _chunks(data, offset + header_size, offset + size):
+                    if chunk[0] == _RES_TABLE_TYPE_TYPE:
+                        types.setdefault(ord(data[chunk[2] + 8]), []).append(chunk)
+
+    @staticmethod
+    def density(config):
+        """Returns screen density of the configuration, 0 for the default one.
+
+        :param config: ResTable_config structure
+        :rtype: int
+        """
+        return struct.unpack_from("<H", config, 14)[0] if len(config) >= 16 else 0
+
+    def values(self, resource_id):
+        """Returns values of the resource in all configurations.
+
+        :param resource_id: resource ID
+        :return: tuples of ResTable_config structure and value
+        :rtype: list
+        """
+        data, values = self._data, []
+        package_id, type_id, index = resource_id >> 24, resource_id >> 16 & 0xFF, resource_id & 0xFFFF
+
+        for _, header_size, offset, _ in self._packages.get(package_id, {}).get(type_id, ()):
+            flags, count, entries_start = struct.unpack_from("<B 2x 2L", data, offset + 9)
+            config = data[offset + 20:offset + 20 + struct.unpack_from("<L", data, offset + 20)[0]]
+
+            entry = None
+            if flags & _FLAG_SPARSE:
+                for i in range(count):
+                    idx, entry_offset = struct.unpack_from("<2H", data, offset + header_size + i * 4)
+                    if idx == index:
+                        entry = entry_offset * 4
+                        break
+            elif index < count:
+                if flags & _FLAG_OFFSET16:
+                    entry = struct.unpack_from("<H", data, offset + header_size + index * 2)[0]
+                    entry = None if entry == 0xFFFF else entry * 4
+                else:
+                    entry = struct.unpack_from("<L", data, offset + header_size + index * 4)[0]
+                    entry = None if entry == _NO_ENTRY else entry
+            if entry is None:
+                continue
+
+            entry += offset + entries_start
+            entry_size, entry_flags = struct.unpack_from("<2H", data, entry)
+            if entry_flags & _FLAG_COMPLEX:
+                continue
+            if entry_flags & _FLAG_COMPACT:
+                # the value type is kept in the flags and the data in place of the key
+                value_type, value = entry_flags >> 8, struct.unpack_from("<L", data, entry + 4)[0]
+            else:
+                value_type, value = struct.unpack_from("<3xB L", data, entry + entry_size)
+            string = self._strings[value] if value_type == TYPE_STRING and self._strings is not None else None
+            values.append((config, Value(value_type, value, string)))
+        return values
+
+    def resolve(self, value, choose=None):
+        """Follows references to a value, by default in the default configuration.
+
+        :param value: value to resolve
+        :param choose: function picking one of (config, value) tuples
+        :return: resolved value or None
+        :rtype: Value
+        """
+        for _ in range(_MAX_REFERENCE_DEPTH):
+            if value is None or value.type != TYPE_REFERENCE:
+                return value
+            values = self.values(value.data)
+            if not values:
+                return None
+            if choose is not None:
+                value = choose(values)[1]
+            else:
+                value = min(values, key=lambda x: x[0][4:].strip(b"\0") != b"")[1]
+        return None
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+from collections import Counter
+from pydbal.exception import DBALDriverError
+
+
+class BlobStore:
+    def __init__(self, db):
+        """Initialises registry of stored objects addressed by content.
+
+        A blob is the object stored by the first upload of some content, other files with the same SHA-256 refer to
+        it and are not stored again. Blobs are reference counted and removed with the last file.
+
+        :param db: database connection pool
+        """
+        self._db = db
+
+    def find(self, sha256, login=None):
+        """Fetches a blob with given content.
+
+        Hashes sent by clients are not verified before a file is attached, so `login` should be given for them: only
+        blobs the user has uploaded are then returned and their content can not be obtained by knowing a hash.
+
+        :param sha256: hex digest of the content
+        :param login: restrict to blobs referenced by files of the user
+        :return: blob or None
+        :rtype: dict
+        """
+        sql, params = "SELECT * FROM blobs b WHERE sha256 = ? AND refs > 0", [sha256.lower()]
+        if login is not None:
+            sql += " AND EXISTS (SELECT * FROM files f WHERE f.sha256 = b.sha256 AND f.login = ?)"
+            params.append(login)
+        return self._db.fetch(sql, *params)
+
+    def attach(self, key, sha256, object_=None, size=None):
+        """Makes the file refer to a blob with its content, registering the file object as a new blob if there is none.
+
+        Without `object_` the file can only refer to a blob stored before.
+
+        :param key: file key
+        :param sha256: hex digest of the content
+        :param object_: key of the object stored for the file
+        :param size: content size
+        :return: object key of the blob, different from `object_` if the content has been stored before, or None if
+            there is no such blob to refer to or the file has been deleted
+        :rtype: str
+        """
+        sha256 = sha256.lower()
+
+        def callback(conn):
+            if object_ is None:
+                blob = conn.query("SELECT object FROM blobs WHERE sha256 = ? FOR UPDATE", sha256).fetch()
+                if blob is None or not conn.execute(
+                        "UPDATE files SET sha256 = ? WHERE `key` = ? AND sha256 IS NULL", sha256, key):
+                    return None
+                conn.execute("UPDATE blobs SET refs = refs + 1 WHERE sha256 = ?", sha256)
+                return blob["object"]
+
+            if not conn.execute("UPDATE files SET sha256 = ? WHERE `key` = ? AND sha256 IS NULL", sha256, key):
+                return None
+            # a single upsert, as SELECT ... FOR UPDATE of a missing blob takes a gap lock, and concurrent
+            # uploads of the same content would deadlock on the following inserts
+            conn.execute("INSERT INTO blobs (sha256, object, size, refs) VALUES (?, ?, ?, 1) "
+                         "ON DUPLICATE KEY UPDATE refs = refs + 1", sha256, object_, size)
+            return conn.query("SELECT object FROM blobs WHERE sha256 = ?", sha256).fetch_column()
+
+        with self._db.locked() as conn:
+            while True:
+                try:
+                    return conn.transaction(callback)
+                except DBALDriverError:
+                    # Error: 1213 (ER_LOCK_DEADLOCK), the transaction has been rolled back and can be repeated
+                    if conn.error_code() != 1213:
+                        raise
+
+    @staticmethod
+    def release(conn, files):
+        """Drops references of deleted files and removes blobs which are no longer referenced.
+
+        Must be called in the transaction deleting the files.
+
+        :param conn: connection with an active transaction
+        :param files: file rows with `sha256`
+        :return: object keys of removed blobs, to be deleted from storage
+        :rtype: list
+        """
+        counts = Counter(x["sha256"] for x in files if x["sha256"])
+        if not counts:
+            return []
+
+        for sha256, count in counts.iteritems():
+            conn.execute("UPDATE blobs SET refs = refs - ? WHERE sha256 = ?", count, sha256)
+        blobs = conn.query(
+            "SELECT sha256, object FROM blobs WHERE sha256 IN (?) AND refs <= 0 FOR UPDATE", counts.keys()).fetch_all()
+        if blobs:
+            conn.execute("DELETE FROM blobs WHERE sha256 IN (?)", [x["sha256"] for x in blobs])
+        return [x["object"] for x in blobs]
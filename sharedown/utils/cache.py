@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+
+from threading import RLock
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size=1024, ttl=None):
+        """Initialises thread-safe LRU cache with optional entry lifetime.
+
+        :param max_size: maximum number of entries
+        :param ttl: default entry lifetime in seconds (`None` to keep entries until evicted)
+        """
+        assert max_size > 0
+
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires_at is not None and expires_at <= time.time():
+                return default
+            self._data[key] = (value, expires_at)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self._ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, None if ttl is None else time.time() + ttl)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                return self._data.pop(key)[0]
+            except KeyError:
+                return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SessionTracker:
+    def __init__(self):
+        """Initialises set of sessions used since the last flush, so that their expiry is extended in bulk.
+
+        Validated sessions are not cached, as logout, disabled users and rotated tokens must take effect in all server
+        processes at once.
+        """
+        self._lock = RLock()
+        self._touched = set()
+
+    def touch(self, session):
+        with self._lock:
+            self._touched.add(session)
+
+    def pop_touched(self):
+        """Returns sessions used since the last call and resets the set.
+
+        :return: set of session keys
+        :rtype: set
+        """
+        with self._lock:
+            touched, self._touched = self._touched, set()
+            return touched
+
+
+class FeedCache(LRUCache):
+    def __init__(self, max_size=1024, ttl=None):
+        """Initialises cache of rendered feeds valid for the feed version they were rendered for.
+
+        Versions are stored with feeds in the database and bumped by triggers on files, so they are shared by all
+        processes.
+
+        :param max_size: maximum number of rendered feeds
+        :param ttl: feed lifetime in seconds
+        """
+        LRUCache.__init__(self, max_size, ttl)
+
+    def get(self, key, version, default=None):
+        entry = LRUCache.get(self, key)
+        if entry is None or entry[0] != version:
+            return default
+        return entry[1]
+
+    def set(self, key, value, version, ttl=None):
+        """Stores rendered feed.
+
+        :param key: cache key
+        :param value: rendered feed
+        :param version: feed version the feed was rendered for
+        :param ttl: feed lifetime in seconds
+        """
+        LRUCache.set(self, key, (version, value), ttl)
+
+
+class FileCache(LRUCache):
+    def __init__(self, max_size=1024, ttl=None):
+        """Initialises cache of file records with their metadata served on download pages.
+
+        Every process has its own cache, so changes made by other processes are seen after `ttl` seconds at most.
+
+        :param max_size: maximum number of files
+        :param ttl: time in seconds before a file is fetched from the database again
+        """
+        LRUCache.__init__(self, max_size, ttl)
+        self._generation = 0
+
+    @staticmethod
+    def _expires_in(entry):
+        expires_at = entry["file"]["expires_at"]
+        return None if expires_at is None else time.mktime(expires_at.timetuple()) - time.time()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key, default=None):
+        entry = LRUCache.get(self, key)
+        if entry is None:
+            return default
+        expires_in = FileCache._expires_in(entry)
+        if expires_in is not None and expires_in <= 0:
+            self.pop(key)
+            return default
+        return entry
+
+    def set(self, key, value, generation=None, ttl=None):
+        """Stores file entry unless the cache has been invalidated since it was fetched.
+
+        :param key: file key
+        :param value: dict with `file` record and `metadata`
+        :param generation: value of `generation()` taken before the file was fetched
+        :param ttl: entry lifetime in seconds, never longer than the file lifetime
+        """
+        if ttl is None:
+            ttl = self._ttl
+        expires_in = FileCache._expires_in(value)
+        if expires_in is not None:
+            if expires_in <= 0:
+                return
+            ttl = expires_in if ttl is None else min(ttl, expires_in)
+        with self._lock:
+            if generation is None or generation == self._generation:
+                LRUCache.set(self, key, value, ttl)
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self.pop(key)
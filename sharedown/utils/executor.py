@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import logging
+
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+
+
+class PoolSaturatedError(Exception):
+    pass
+
+
+class ProcessPool:
+    def __init__(self, max_workers, max_pending):
+        """Initialises bounded process pool for CPU-bound tasks.
+
+        :param max_workers: number of worker processes
+        :param max_pending: maximum number of queued and running tasks before new tasks are rejected
+        """
+        self._executor = ProcessPoolExecutor(max_workers)
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def saturated(self):
+        return self._pending >= self._max_pending
+
+    def _done(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules a picklable callable to be executed in a worker process.
+
+        :param fn: module level function
+        :return: future of the result
+        :rtype: concurrent.futures.Future
+        :raise: PoolSaturatedError
+        """
+        with self._lock:
+            if self._pending >= self._max_pending:
+                logging.warning("Process pool is saturated: %d tasks pending", self._pending)
+                raise PoolSaturatedError()
+            self._pending += 1
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
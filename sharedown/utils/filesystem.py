@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import io
+import os
+import time
+import errno
+import shutil
+import base64
+import hashlib
+import tempfile
+import threading
+
+from datetime import datetime
+from urllib import quote
+from tornado.web import create_signed_value, decode_signed_value
+from tornado.escape import json_encode, json_decode
+
+from . import chunks, random_bytes
+from .storage import Storage
+
+
+class FileSystem(Storage):
+    UPLOADS_DIR = ".uploads"
+    COPY_BUFFER_SIZE = 1024 ** 2
+
+    def __init__(self, root, secret, storage_lifetime, download_url_lifetime=60, url_prefix="/storage/",
+                 accel_redirect=None, **kwargs):
+        """Initialises storage of objects as files under `root` directory, e.g. on a local or NFS mounted disk.
+
+        Download URLs point to the application (`url_prefix`) and are signed with `secret`. With `accel_redirect`
+        the application only responds with "X-Accel-Redirect" header to the internal location of the front proxy
+        serving `root` directory, so file data is never copied by the application. Without it files are streamed by
+        the application, which is enough for development.
+
+        :param root: storage directory
+        :param secret: key signing download URLs
+        :param storage_lifetime: number of seconds files are kept by default
+        :param download_url_lifetime: number of seconds download URLs are valid for
+        :param url_prefix: path of the download handler
+        :param accel_redirect: internal location of the front proxy mapped to `root` directory
+        """
+        Storage.__init__(self, storage_lifetime)
+        self._root = os.path.abspath(root)
+        self._secret = secret
+        self._download_url_lifetime = download_url_lifetime
+        self._url_prefix = url_prefix
+        self.accel_redirect = accel_redirect
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self._root, key))
+        if not path.startswith(self._root + os.sep):
+            raise ValueError("Invalid object key: %s" % key)
+        return path
+
+    def _write(self, key, write):
+        """Writes an object to a temporary file and moves it in place, so it is never seen partially written."""
+        path = self.path(key)
+        _makedirs(os.path.dirname(path))
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.rename(tmp, path)
+        except:
+            _remove(tmp)
+            raise
+
+    def upload_file(self, filename, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None):
+        started = time.time()
+
+        def write(f):
+            with open(filename, "rb") as src:
+                shutil.copyfileobj(src, f, FileSystem.COPY_BUFFER_SIZE)
+
+        self._write(key, write)
+        self._record_transfer(key, os.path.getsize(filename), started)
+
+    def put_object(self, data, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None, cache_control=None):
+        started = time.time()
+        self._write(key, lambda f: f.write(data))
+        self._record_transfer(key, len(data), started)
+
+    def get_object(self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        return None
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self.path(key))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        return {"size": stat.st_size, "modified": datetime.fromtimestamp(stat.st_mtime)}
+
+    def open(self, key, size=None, buffer_size=262144):
+        return io.open(self.path(key), "rb", buffering=buffer_size)
+
+    def download_url(self, key, filename=None):
+        if filename is not None and key.rsplit("/", 1)[-1] == filename:
+            filename = None
+        value = json_encode([key, filename, int(time.time()) + self._download_url_lifetime])
+        token = base64.urlsafe_b64encode(create_signed_value(self._secret, "storage", value))
+        return self._url_prefix + token
+
+    def resolve_url(self, token):
+        """Verifies a token of a download URL.
+
+        :return: object key and file name to save the object with, or None if the token is invalid or expired
+        :rtype: tuple
+        """
+        try:
+            value = decode_signed_value(self._secret, "storage", base64.urlsafe_b64decode(str(token)), 1)
+            if value is not None:
+                key, filename, expires_at = json_decode(value)
+                if expires_at >= time.time():
+                    return key, filename or key.rsplit("/", 1)[-1]
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    def accel_redirect_path(self, key):
+        return self.accel_redirect.rstrip("/") + "/" + quote(key.encode("utf-8") if isinstance(key, unicode) else key)
+
+    def delete(self, key):
+        path = self.path(key)
+        _remove(path)
+        _rmdir(os.path.dirname(path), self._root)
+
+    def delete_many(self, keys):
+        deleted = []
+        for chunk in chunks(keys, Storage.DELETE_MANY_LIMIT):
+            for key in chunk:
+                self.delete(key)
+                deleted.append(key)
+        return deleted
+
+    def create_multipart_upload(self, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None):
+        upload = FileMultipartUpload(self, key, random_bytes(16), self._record_transfer)
+        _makedirs(upload.directory)
+        return upload
+
+    def get_multipart_upload(self, key, upload_id):
+        return FileMultipartUpload(self, key, upload_id)
+
+    def uploads_directory(self, upload_id):
+        return os.path.join(self._root, FileSystem.UPLOADS_DIR, upload_id)
+
+
+class FileMultipartUpload:
+    def __init__(self, storage, key, upload_id, on_complete=None):
+        """Initialises multipart upload, parts are kept as separate files until the upload is completed.
+
+        :param on_complete: callback receiving key, number of uploaded bytes and start time, called on completion
+        """
+        self._storage = storage
+        self._key = key
+        self.upload_id = upload_id
+        self.directory = storage.uploads_directory(upload_id)
+        self._on_complete = on_complete
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def _part_path(self, number):
+        return os.path.join(self.directory, "%05d" % number)
+
+    def upload_part(self, number, data):
+        if not os.path.isdir(self.directory):
+            raise IOError(errno.ENOENT, "No such upload: %s" % self.upload_id)
+        fd, tmp = tempfile.mkstemp(prefix=".", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.rename(tmp, self._part_path(number))
+        except:
+            _remove(tmp)
+            raise
+        with self._lock:
+            self._size += len(data)
+        return {"PartNumber": number, "ETag": '"%s"' % hashlib.md5(data).hexdigest()}
+
+    def complete(self, parts):
+        def write(f):
+            for part in sorted(parts, key=lambda x: x["PartNumber"]):
+                with open(self._part_path(part["PartNumber"]), "rb") as src:
+                    shutil.copyfileobj(src, f, FileSystem.COPY_BUFFER_SIZE)
+
+        self._storage._write(self._key, write)
+        shutil.rmtree(self.directory, True)
+        if self._on_complete is not None:
+            self._on_complete(self._key, self._size, self._started)
+
+    def list_parts(self):
+        parts = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.startswith("."):
+                parts.append({"PartNumber": int(name), "Size": os.path.getsize(os.path.join(self.directory, name))})
+        return parts
+
+    def abort(self):
+        shutil.rmtree(self.directory, True)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _rmdir(path, root):
+    # remove directories of the key left empty (e.g. "<key>/@icon" and "<key>")
+    while path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
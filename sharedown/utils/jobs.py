@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import logging
+
+from datetime import timedelta
+from tornado import gen
+from tornado.locks import Event
+from tornado.ioloop import IOLoop
+from tornado.escape import json_encode, json_decode
+from concurrent.futures import ThreadPoolExecutor
+
+from . import random_bytes
+
+
+class JobQueue:
+    STATUS_PENDING = "PENDING"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_DONE = "DONE"
+    STATUS_FAILED = "FAILED"
+
+    def __init__(self, db, lease_time=300, max_attempts=5, retry_delay=30):
+        """Initialises persistent job queue stored in `jobs` table, shared by all processes.
+
+        A claimed job is leased for `lease_time` seconds and the lease is renewed while the job runs. If it is not
+        renewed in time (e.g. its process has died), the job is claimed again by any worker.
+
+        :param db: database connection pool
+        :param lease_time: number of seconds a job is leased for
+        :param max_attempts: number of attempts before a job fails
+        :param retry_delay: number of seconds before the first retry, doubled with every next attempt
+        """
+        self._db = db
+        self.lease_time = lease_time
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+
+    @staticmethod
+    def _decode(job):
+        for column in ("payload", "result"):
+            if job[column] is not None:
+                job[column] = json_decode(job[column])
+        return job
+
+    def enqueue(self, type_, payload=None, key=None, login=None, conn=None):
+        """Adds a job to the queue.
+
+        :param type_: job type
+        :param payload: JSON serializable arguments
+        :param key: related file key
+        :param login: user login
+        :param conn: connection of an active transaction the job should be a part of
+        :return: job ID
+        :rtype: int
+        """
+        values = {"type": type_, "`key`": key, "login": login, "payload": json_encode(payload)}
+        if conn is not None:
+            return conn.insert("jobs", values)
+        return self._db.insert("jobs", values)
+
+    def claim(self, types, limit):
+        """Leases jobs which are due or have timed out.
+
+        :param types: job types to claim
+        :param limit: maximum number of jobs
+        :return: leased jobs
+        :rtype: list
+        """
+        lease = random_bytes(16)
+        with self._db.locked() as conn:
+            # jobs timed out too many times are not retried
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease = NULL, error = ? WHERE status = ? AND leased_until < NOW() "
+                "AND attempts >= ?", JobQueue.STATUS_FAILED, "Timed out", JobQueue.STATUS_RUNNING, self._max_attempts)
+
+            if not conn.execute(
+                    "UPDATE jobs SET status = ?, lease = ?, attempts = attempts + 1, leased_until = NOW() + INTERVAL "
+                    "%d SECOND WHERE type IN (?) AND (status = ? AND run_at <= NOW() OR status = ? AND "
+                    "leased_until < NOW()) ORDER BY id LIMIT %d" % (self.lease_time, limit),
+                    JobQueue.STATUS_RUNNING, lease, types, JobQueue.STATUS_PENDING, JobQueue.STATUS_RUNNING):
+                return []
+            jobs = conn.query("SELECT * FROM jobs WHERE lease = ? ORDER BY id", lease).fetch_all()
+        return map(JobQueue._decode, jobs)
+
+    def complete(self, job, result=None):
+        return self._db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease = NULL, leased_until = NULL "
+            "WHERE id = ? AND lease = ?", JobQueue.STATUS_DONE, json_encode(result), job["id"], job["lease"])
+
+    def save_result(self, job, result):
+        """Stores a partial result of a running job, which is passed to its next attempts."""
+        return self._db.execute(
+            "UPDATE jobs SET result = ? WHERE id = ? AND lease = ?", json_encode(result), job["id"], job["lease"])
+
+    def renew(self, job):
+        """Extends the lease of a running job.
+
+        :return: False if the lease has been lost
+        :rtype: bool
+        """
+        return bool(self._db.execute(
+            "UPDATE jobs SET leased_until = NOW() + INTERVAL %d SECOND WHERE id = ? AND lease = ?" % self.lease_time,
+            job["id"], job["lease"]))
+
+    def fail(self, job, error):
+        """Schedules the job for a retry with an exponential delay, or fails it after the last attempt."""
+        if job["attempts"] >= self._max_attempts:
+            return self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease = NULL, leased_until = NULL WHERE id = ? AND lease = ?",
+                JobQueue.STATUS_FAILED, error, job["id"], job["lease"])
+
+        delay = self._retry_delay * 2 ** (job["attempts"] - 1)
+        return self._db.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease = NULL, leased_until = NULL, "
+            "run_at = NOW() + INTERVAL %d SECOND WHERE id = ? AND lease = ?" % delay,
+            JobQueue.STATUS_PENDING, error, job["id"], job["lease"])
+
+    def get(self, id_, login=None):
+        sql, params = "SELECT * FROM jobs WHERE id = ?", [id_]
+        if login is not None:
+            sql += " AND login = ?"
+            params.append(login)
+        job = self._db.fetch(sql, *params)
+        return JobQueue._decode(job) if job else None
+
+    def get_latest(self, key, type_):
+        """Fetches the latest job of given type for a file.
+
+        :return: job or None
+        :rtype: dict
+        """
+        job = self._db.fetch("SELECT * FROM jobs WHERE `key` = ? AND type = ? ORDER BY id DESC LIMIT 1", key, type_)
+        return JobQueue._decode(job) if job else None
+
+    def purge(self, age):
+        """Removes finished jobs older than given number of seconds.
+
+        :return: number of removed jobs
+        :rtype: int
+        """
+        return self._db.execute(
+            "DELETE FROM jobs WHERE status IN (?) AND updated_at < NOW() - INTERVAL %d SECOND" % age,
+            (JobQueue.STATUS_DONE, JobQueue.STATUS_FAILED))
+
+
+class JobWorker:
+    def __init__(self, queue, thread_pool, concurrency=2, poll_interval=5, max_runtime=1800):
+        """Initialises pool of workers running jobs from the queue in threads. Must be used on the IOLoop thread only.
+
+        :param queue: job queue
+        :param thread_pool: executor for queue bookkeeping
+        :param concurrency: number of jobs run at once
+        :param poll_interval: number of seconds between checks for jobs added by other processes
+        :param max_runtime: number of seconds after which a running job is failed
+        """
+        self._queue = queue
+        self._thread_pool = thread_pool
+        self._executor = ThreadPoolExecutor(concurrency)
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._max_runtime = max_runtime
+        self._handlers = {}
+        self._running = 0
+        self._wakeup = Event()
+
+    def register(self, type_, handler):
+        """Registers job handler.
+
+        :param type_: job type
+        :param handler: function called in a worker thread with the job, its return value is stored as the job
+            result
+        """
+        self._handlers[type_] = handler
+
+    def wake(self):
+        """Checks for new jobs without waiting for the next poll."""
+        self._wakeup.set()
+
+    @gen.coroutine
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            limit = self._concurrency - self._running
+            if limit > 0 and self._handlers:
+                try:
+                    jobs = yield self._thread_pool.submit(self._queue.claim, self._handlers.keys(), limit)
+                except Exception as e:
+                    logging.error("Failed to claim jobs: %s", e)
+                    jobs = []
+                for job in jobs:
+                    self._running += 1
+                    IOLoop.current().spawn_callback(self._run, job)
+
+            try:
+                yield self._wakeup.wait(timedelta(seconds=self._poll_interval))
+            except gen.TimeoutError:
+                pass
+
+    def _release(self, future):
+        self._running -= 1
+        self.wake()
+
+    @gen.coroutine
+    def _run(self, job):
+        future = self._executor.submit(self._handlers[job["type"]], job)
+        # the slot is taken until the thread is done, so claimed jobs never wait for a thread
+        IOLoop.current().add_future(future, self._release)
+        try:
+            io_loop = IOLoop.current()
+            deadline = io_loop.time() + self._max_runtime
+            while True:
+                try:
+                    result = yield gen.with_timeout(min(io_loop.time() + self._queue.lease_time / 2, deadline), future)
+                    break
+                except gen.TimeoutError:
+                    # threads can not be stopped: until the deadline the job keeps its lease to not be claimed again
+                    # while it runs, after it the job is failed and the thread keeps its slot until it returns
+                    if io_loop.time() >= deadline:
+                        raise gen.TimeoutError("Timed out")
+                    if not (yield self._thread_pool.submit(self._queue.renew, job)):
+                        logging.warning("Job %d (%s) has lost its lease", job["id"], job["type"])
+            yield self._thread_pool.submit(self._queue.complete, job, result)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            logging.error("Job %d (%s) failed on attempt %d: %s", job["id"], job["type"], job["attempts"], error)
+            try:
+                yield self._thread_pool.submit(self._queue.fail, job, error[:255])
+            except Exception as e:
+                logging.error("Failed to update job %d: %s", job["id"], e)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
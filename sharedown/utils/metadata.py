@@ -22,9 +22,27 @@
 
 from __future__ import absolute_import, division, print_function, with_statement
 
+import re
 import os.path
 
-from ipa import IPAFile
+from . import png
+from . import plist
+from . import android
+from .ziparchive import ZipArchive
+
+_IPA_INFO_PLIST = re.compile(r"^Payload/[^/]+\.app/Info\.plist$")
+_IPA_IMAGE = re.compile(r"^Payload/[^/]+\.app/([^/]+)\.png$")
+_IPA_ICON_SUFFIX = re.compile(r"^(@\dx)?(~ipad|~iphone)?$")
+_IPA_INFO_PLIST_MAX_SIZE = 1024 ** 2
+_IPA_DEVICE_FAMILIES = {1: "iPhone", 2: "iPad"}
+_APK_MANIFEST = "AndroidManifest.xml"
+_APK_MANIFEST_MAX_SIZE = 4 * 1024 ** 2
+_APK_RESOURCES = "resources.arsc"
+_APK_RESOURCES_MAX_SIZE = 32 * 1024 ** 2
+_APK_DENSITY_DEFAULT = 160
+_APK_DENSITY_ANY = 0xFFFE
+_ICON_MAX_CANDIDATES = 16
+_ICON_MAX_SIZE = 1024 ** 2
 
 
 class Metadata(dict):
@@ -32,23 +50,150 @@ class Metadata(dict):
     APP_NAME = "app-name"
     APP_VERSION = "app-version"
     BUNDLE_ID = "bundle-id"
+    APP_BUILD = "app-build"
+    MIN_SDK = "min-sdk"
+    TARGET_SDK = "target-sdk"
+
+    def __init__(self, path, ext=None, icon_size=None):
+        """Extracts application metadata from IPA and APK packages.
 
-    def __init__(self, path, ext=None):
+        :param path: path to a file or seekable file object
+        :param ext: file extension, taken from the path if not given
+        :param icon_size: if given, the application icon closest to (but not smaller than) this size is read into
+            `icon` attribute as PNG image (possibly crushed by Xcode)
+        """
+        self.icon = None
         if ext is None:
             ext = os.path.splitext(path.lower())[1]
 
         try:
             if ext == ".ipa":
-                super(Metadata, self).__init__(Metadata._ipa(path))
+                attributes, self.icon = Metadata._ipa(path, icon_size)
+                super(Metadata, self).__init__(attributes)
+            elif ext == ".apk":
+                attributes, self.icon = Metadata._apk(path, icon_size)
+                super(Metadata, self).__init__(attributes)
         except StandardError:
             pass
 
     @staticmethod
-    def _ipa(path):
-        with IPAFile(path) as ipa:
-            return (
-                (Metadata.DEVICE_FAMILY, ipa.get_device_family()),
-                (Metadata.APP_NAME, ipa.get_app_name()),
-                (Metadata.APP_VERSION, ipa.get_app_version()),
-                (Metadata.BUNDLE_ID, ipa.app_info["CFBundleIdentifier"]),
-            )
+    def _read_icon(archive, entries, size):
+        """Reads the smallest image not smaller than the size, or the largest one."""
+        icons = []
+        for entry in entries[:_ICON_MAX_CANDIDATES]:
+            try:
+                data = archive.read(entry, _ICON_MAX_SIZE)
+                icons.append((min(png.get_size(data)), data))
+            except StandardError:
+                continue
+        if not icons:
+            return None
+        return min(icons, key=lambda x: (x[0] < size, abs(x[0] - size)))[1]
+
+    @staticmethod
+    def _ipa(path, icon_size=None):
+        # only the central directory and Info.plist (with the icon) are read, not the whole archive
+        with ZipArchive(path) as archive:
+            entry, images = None, []
+            for x in archive.entries():
+                if _IPA_INFO_PLIST.match(x.name):
+                    entry = entry or x
+                elif icon_size and _IPA_IMAGE.match(x.name):
+                    images.append(x)
+            if entry is None:
+                return (), None
+            info = plist.loads(archive.read(entry, _IPA_INFO_PLIST_MAX_SIZE))
+
+            icon = None
+            if icon_size:
+                icon = Metadata._read_icon(archive, Metadata._ipa_icons(info, images), icon_size)
+
+        families = info.get("UIDeviceFamily") or [1]
+        if not isinstance(families, list):
+            families = [families]
+        families = set(_IPA_DEVICE_FAMILIES.get(int(x)) for x in families) - {None}
+        family = families.pop() if len(families) == 1 else "Universal" if families else None
+
+        return tuple(x for x in (
+            (Metadata.DEVICE_FAMILY, family),
+            (Metadata.APP_NAME, info.get("CFBundleDisplayName") or info.get("CFBundleName")),
+            (Metadata.APP_VERSION, info.get("CFBundleShortVersionString") or info.get("CFBundleVersion")),
+            (Metadata.BUNDLE_ID, info["CFBundleIdentifier"]),
+        ) if x[1] is not None), icon
+
+    @staticmethod
+    def _ipa_icons(info, images):
+        """Selects images in the bundle root named after the icons listed in Info.plist."""
+        names = []
+        for key in ("CFBundleIcons", "CFBundleIcons~ipad"):
+            icons = info.get(key)
+            if isinstance(icons, dict) and isinstance(icons.get("CFBundlePrimaryIcon"), dict):
+                names.extend(icons["CFBundlePrimaryIcon"].get("CFBundleIconFiles") or ())
+        names.extend(info.get("CFBundleIconFiles") or ())
+        if info.get("CFBundleIconFile"):
+            names.append(info["CFBundleIconFile"])
+        names = [os.path.splitext(x)[0] for x in names if isinstance(x, basestring)] or ["AppIcon", "Icon"]
+
+        def match(image):
+            name = _IPA_IMAGE.match(image.name).group(1)
+            return any(name.startswith(x) and _IPA_ICON_SUFFIX.match(name[len(x):]) for x in names)
+        return filter(match, images)
+
+    @staticmethod
+    def _apk(path, icon_size=None):
+        # the manifest is decoded from the archive directly, resources are read only to resolve references
+        with ZipArchive(path) as archive:
+            entries = dict((x.name, x) for x in archive.entries() if x.name in (_APK_MANIFEST, _APK_RESOURCES) or (
+                icon_size and x.name.startswith("res/") and x.name.endswith(".png")))
+            if _APK_MANIFEST not in entries:
+                return (), None
+            manifest = android.parse_manifest(archive.read(entries[_APK_MANIFEST], _APK_MANIFEST_MAX_SIZE))
+
+            attributes = dict(manifest.get("manifest", {}))
+            attributes.update(manifest.get("uses-sdk", {}))
+            for name in ("label", "icon"):
+                if name in manifest.get("application", {}):
+                    attributes[name] = manifest["application"][name]
+            if not icon_size:
+                attributes.pop("icon", None)
+
+            table = None
+            if _APK_RESOURCES in entries and any(x.type == android.TYPE_REFERENCE for x in attributes.values()):
+                table = android.ResourceTable(archive.read(entries[_APK_RESOURCES], _APK_RESOURCES_MAX_SIZE))
+
+            icon = None
+            if "icon" in attributes:
+                icon = Metadata._read_icon(archive, Metadata._apk_icons(attributes["icon"], table, entries), icon_size)
+
+        def get(name):
+            value = attributes.get(name)
+            if table is not None:
+                value = table.resolve(value)
+            value = value.value if value is not None else None
+            return value if value is None else unicode(value)[:255]
+
+        return tuple(x for x in (
+            (Metadata.APP_NAME, get("label")),
+            (Metadata.APP_VERSION, get("versionName")),
+            (Metadata.APP_BUILD, get("versionCode")),
+            (Metadata.BUNDLE_ID, get("package")),
+            (Metadata.MIN_SDK, get("minSdkVersion")),
+            (Metadata.TARGET_SDK, get("targetSdkVersion")),
+        ) if x[1] is not None), icon
+
+    @staticmethod
+    def _apk_icons(value, table, entries):
+        """Selects PNG icon files from all density configurations, highest density first."""
+        if value.type == android.TYPE_STRING:
+            values = [(b"", value)]
+        elif table is not None and value.type == android.TYPE_REFERENCE:
+            values = [(x[0], table.resolve(x[1])) for x in table.values(value.data)]
+        else:
+            return []
+
+        icons = []
+        for config, x in values:
+            if x is not None and x.type == android.TYPE_STRING and x.string in entries:
+                density = android.ResourceTable.density(config) or _APK_DENSITY_DEFAULT
+                icons.append((0 if density >= _APK_DENSITY_ANY else density, entries[x.string]))
+        return [x[1] for x in sorted(icons, key=lambda x: -x[0])]
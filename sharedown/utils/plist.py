@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import struct
+import plistlib
+
+from datetime import datetime, timedelta
+
+_BINARY_MAGIC = b"bplist00"
+_BINARY_EPOCH = datetime(2001, 1, 1)
+_MAX_DEPTH = 64
+
+
+class PlistError(ValueError):
+    pass
+
+
+def loads(data):
+    """Parses property list in binary or XML format.
+
+    :param data: property list contents
+    :return: top level object
+    """
+    if data.startswith(_BINARY_MAGIC):
+        return _BinaryPlist(data).parse()
+    try:
+        return plistlib.readPlistFromString(data)
+    except Exception as e:
+        raise PlistError("Invalid XML property list: %s" % e)
+
+
+class _BinaryPlist:
+    def __init__(self, data):
+        if len(data) < len(_BINARY_MAGIC) + 32:
+            raise PlistError("Truncated binary property list")
+
+        self._data = data
+        offset_size, self._ref_size, count, self._top, table = struct.unpack(">6xBBQQQ", data[-32:])
+        if not offset_size or not self._ref_size or table + count * offset_size > len(data) - 32:
+            raise PlistError("Invalid binary property list trailer")
+        self._offsets = [
+            self._uint(data[table + i * offset_size:table + (i + 1) * offset_size]) for i in range(count)
+        ]
+        # objects may be referred many times, each one is decoded once so that nested references to the same
+        # containers can not make parsing exponential
+        self._objects = {}
+
+    @staticmethod
+    def _uint(data):
+        value = 0
+        for byte in bytearray(data):
+            value = value << 8 | byte
+        return value
+
+    def parse(self):
+        return self._object(self._top, 0)
+
+    def _count(self, offset, info):
+        """Returns number of items and offset of the first one."""
+        if info != 0xF:
+            return info, offset + 1
+        marker = ord(self._data[offset + 1])
+        if marker >> 4 != 0x1:
+            raise PlistError("Invalid object length at %d" % offset)
+        size = 1 << (marker & 0xF)
+        return self._uint(self._data[offset + 2:offset + 2 + size]), offset + 2 + size
+
+    def _refs(self, offset, count):
+        size = self._ref_size
+        return [self._uint(self._data[offset + i * size:offset + (i + 1) * size]) for i in range(count)]
+
+    def _object(self, ref, depth):
+        if depth > _MAX_DEPTH or ref >= len(self._offsets):
+            raise PlistError("Invalid object reference %d" % ref)
+
+        if ref not in self._objects:
+            self._objects[ref] = self._decode(ref, depth)
+        return self._objects[ref]
+
+    def _decode(self, ref, depth):
+        data, offset = self._data, self._offsets[ref]
+        marker = ord(data[offset])
+        kind, info = marker >> 4, marker & 0xF
+
+        if marker == 0x00:
+            return None
+        elif marker == 0x08:
+            return False
+        elif marker == 0x09:
+            return True
+        elif kind == 0x1:
+            size = 1 << info
+            value = self._uint(data[offset + 1:offset + 1 + size])
+            # only 8 and 16 byte integers are signed
+            if size >= 8 and value >> (size * 8 - 1):
+                value -= 1 << size * 8
+            return value
+        elif kind == 0x2:
+            size = 1 << info
+            return struct.unpack(">f" if size == 4 else ">d", data[offset + 1:offset + 1 + size])[0]
+        elif marker == 0x33:
+            return _BINARY_EPOCH + timedelta(seconds=struct.unpack(">d", data[offset + 1:offset + 9])[0])
+        elif kind == 0x4:
+            count, start = self._count(offset, info)
+            return plistlib.Data(data[start:start + count])
+        elif kind == 0x5:
+            count, start = self._count(offset, info)
+            return data[start:start + count].decode("ascii")
+        elif kind == 0x6:
+            count, start = self._count(offset, info)
+            return data[start:start + count * 2].decode("utf_16_be")
+        elif kind == 0x8:
+            return self._uint(data[offset + 1:offset + 2 + info])
+        elif kind in (0xA, 0xC):
+            count, start = self._count(offset, info)
+            return [self._object(x, depth + 1) for x in self._refs(start, count)]
+        elif kind == 0xD:
+            count, start = self._count(offset, info)
+            keys = self._refs(start, count)
+            values = self._refs(start + count * self._ref_size, count)
+            return dict((self._object(k, depth + 1), self._object(v, depth + 1)) for k, v in zip(keys, values))
+        raise PlistError("Unknown object type 0x%02x at %d" % (marker, offset))
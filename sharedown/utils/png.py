@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import zlib
+import struct
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# decoding is done in pure Python, so larger images are refused to bound CPU time
+MAX_DIMENSION = 1024
+
+
+class PNGError(ValueError):
+    pass
+
+
+def _chunks(data):
+    if not data.startswith(_SIGNATURE):
+        raise PNGError("Not a PNG image")
+    position = len(_SIGNATURE)
+    while position + 8 <= len(data):
+        length, type_ = struct.unpack_from(">L4s", data, position)
+        yield type_, data[position + 8:position + 8 + length]
+        position += length + 12
+        if type_ == b"IEND":
+            break
+
+
+def get_size(data):
+    """Returns image dimensions without decoding it.
+
+    :param data: PNG image, possibly crushed by Xcode
+    :return: width and height
+    :rtype: tuple
+    """
+    for type_, chunk in _chunks(data):
+        if type_ == b"IHDR":
+            return struct.unpack(">2L", chunk[:8])
+    raise PNGError("Image header not found")
+
+
+def _unfilter(data, width, height, bpp):
+    stride = width * bpp
+    rows, previous = [], bytearray(stride)
+    for y in range(height):
+        offset = y * (stride + 1)
+        filter_, row = ord(data[offset]), bytearray(data[offset + 1:offset + 1 + stride])
+        if filter_ == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif filter_ == 2:
+            for i in range(stride):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif filter_ == 3:
+            for i in range(stride):
+                row[i] = (row[i] + ((row[i - bpp] if i >= bpp else 0) + previous[i] >> 1)) & 0xFF
+        elif filter_ == 4:
+            for i in range(stride):
+                a, b = row[i - bpp] if i >= bpp else 0, previous[i]
+                c = previous[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+        elif filter_ != 0:
+            raise PNGError("Unknown filter type %d" % filter_)
+        rows.append(row)
+        previous = row
+    return rows
+
+
+def decode(data):
+    """Decodes 8 or 16-bit non-interlaced PNG image into RGBA pixels.
+
+    Images crushed by Xcode (with CgBI chunk) are restored: they have raw deflate stream, BGRA channel order and
+    premultiplied alpha.
+
+    :param data: PNG image
+    :return: width, height and RGBA pixels
+    :rtype: tuple
+    """
+    header, palette, transparency, idat, crushed = None, None, None, [], False
+    for type_, chunk in _chunks(data):
+        if type_ == b"CgBI":
+            crushed = True
+        elif type_ == b"IHDR":
+            header = struct.unpack(">2L5B", chunk[:13])
+        elif type_ == b"PLTE":
+            palette = bytearray(chunk)
+        elif type_ == b"tRNS":
+            transparency = bytearray(chunk)
+        elif type_ == b"IDAT":
+            idat.append(chunk)
+    if header is None:
+        raise PNGError("Image header not found")
+
+    width, height, depth, color_type, _, _, interlace = header
+    if depth not in (8, 16) or color_type not in _CHANNELS or interlace:
+        raise PNGError("Unsupported image format")
+    if not 0 < width <= MAX_DIMENSION or not 0 < height <= MAX_DIMENSION:
+        raise PNGError("Image is too large")
+
+    bpp = _CHANNELS[color_type] * depth // 8
+    size = height * (width * bpp + 1)
+    raw = zlib.decompressobj(-zlib.MAX_WBITS if crushed else zlib.MAX_WBITS).decompress(b"".join(idat), size)
+    if len(raw) != size:
+        raise PNGError("Truncated image data")
+
+    pixels = bytearray(width * height * 4)
+    for y, row in enumerate(_unfilter(raw, width, height, bpp)):
+        out = y * width * 4
+        if depth == 16:
+            row = row[::2]
+        if color_type == 6:
+            pixels[out:out + width * 4] = row
+        elif color_type == 2:
+            for c in range(3):
+                pixels[out + c:out + width * 4:4] = row[c::3]
+            pixels[out + 3:out + width * 4:4] = b"\xff" * width
+        elif color_type == 0 or color_type == 4:
+            for c in range(3):
+                pixels[out + c:out + width * 4:4] = row[::_CHANNELS[color_type]]
+            pixels[out + 3:out + width * 4:4] = row[1::2] if color_type == 4 else b"\xff" * width
+        else:
+            if palette is None:
+                raise PNGError("Palette not found")
+            for x, index in enumerate(row):
+                if index * 3 + 3 > len(palette):
+                    raise PNGError("Invalid palette index")
+                pixels[out + x * 4:out + x * 4 + 3] = palette[index * 3:index * 3 + 3]
+                pixels[out + x * 4 + 3] = transparency[index] if transparency and index < len(transparency) else 255
+
+    if crushed:
+        pixels[0::4], pixels[2::4] = pixels[2::4], pixels[0::4]
+        for i in range(0, len(pixels), 4):
+            alpha = pixels[i + 3]
+            if 0 < alpha < 255:
+                for c in range(i, i + 3):
+                    pixels[c] = min(255, pixels[c] * 255 // alpha)
+    return width, height, pixels
+
+
+def encode(width, height, pixels):
+    """Encodes RGBA pixels into PNG image.
+
+    :rtype: str
+    """
+    def chunk(type_, data):
+        return struct.pack(">L", len(data)) + type_ + data + struct.pack(">L", zlib.crc32(type_ + data) & 0xFFFFFFFF)
+
+    stride = width * 4
+    raw = b"".join(b"\0" + bytes(pixels[y * stride:(y + 1) * stride]) for y in range(height))
+    return b"".join((
+        _SIGNATURE,
+        chunk(b"IHDR", struct.pack(">2L5B", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw, 9)),
+        chunk(b"IEND", b""),
+    ))
+
+
+def resize(width, height, pixels, size):
+    """Scales image to fit into a square of given size, averaging colours weighted by alpha.
+
+    :return: width, height and RGBA pixels
+    :rtype: tuple
+    """
+    scale = size / max(width, height)
+    new_width, new_height = max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    def bounds(index, old, new):
+        start = index * old // new
+        return start, max(start + 1, (index + 1) * old // new)
+
+    result = bytearray(new_width * new_height * 4)
+    columns = [bounds(x, width, new_width) for x in range(new_width)]
+    for y in range(new_height):
+        y0, y1 = bounds(y, height, new_height)
+        for x, (x0, x1) in enumerate(columns):
+            r = g = b = a = 0
+            for sy in range(y0, y1):
+                row = sy * width * 4
+                for i in range(row + x0 * 4, row + x1 * 4, 4):
+                    alpha = pixels[i + 3]
+                    r += pixels[i] * alpha
+                    g += pixels[i + 1] * alpha
+                    b += pixels[i + 2] * alpha
+                    a += alpha
+            out = (y * new_width + x) * 4
+            if a:
+                result[out:out + 4] = bytearray((r // a, g // a, b // a, a // ((y1 - y0) * (x1 - x0))))
+    return new_width, new_height, result
+
+
+def thumbnails(data, sizes):
+    """Normalises an icon and scales it to given sizes. Module level, so can be run in a process pool.
+
+    :param data: PNG image
+    :param sizes: thumbnail sizes
+    :return: PNG images by size
+    :rtype: dict
+    """
+    width, height, pixels = decode(data)
+    return dict((size, encode(*resize(width, height, pixels, size))) for size in sizes)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+import logging
+
+from threading import Condition, local
+from contextlib import contextmanager
+from pydbal.connection import Connection
+from pydbal.exception import DBALError
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, params, min_size=1, max_size=4, timeout=10, ping_interval=60):
+        """Initialises bounded database connection pool.
+
+        Connections are checked out per thread: nested checkouts on the same thread share one connection.
+
+        :param params: pyDBAL connection parameters
+        :param min_size: number of connections opened in advance
+        :param max_size: pool capacity
+        :param timeout: seconds to wait for a free connection before giving up
+        :param ping_interval: seconds a connection may stay idle before it is checked on checkout
+        """
+        assert 0 <= min_size <= max_size and max_size > 0
+
+        self._params = params
+        self._min_size = min_size
+        self._max_size = max_size
+        self._timeout = timeout
+        self._ping_interval = ping_interval
+
+        self._idle = []
+        self._size = 0
+        self._cond = Condition()
+        self._local = local()
+
+        for _ in range(min_size):
+            try:
+                self._idle.append((Connection(**params), time.time()))
+                self._size += 1
+            except DBALError as e:
+                logging.warning("Failed to open pooled connection: %s", e)
+                break
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def _acquire(self):
+        deadline = time.time() + self._timeout
+        with self._cond:
+            while not self._idle and self._size >= self._max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeoutError("No database connection available in %s seconds" % self._timeout)
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn, used_at = self._idle.pop()
+            else:
+                conn, used_at = None, None
+                self._size += 1
+
+        if conn is None:
+            try:
+                return Connection(**self._params)
+            except:
+                self._discard()
+                raise
+
+        if time.time() - used_at > self._ping_interval:
+            try:
+                conn.query("SELECT 1").fetch_all()
+            except DBALError:
+                try:
+                    conn.connect()
+                except:
+                    self._discard()
+                    raise
+        return conn
+
+    def _release(self, conn):
+        try:
+            conn.get_driver().clear()
+            if conn.is_transaction_active():
+                conn.rollback()
+        except DBALError:
+            conn.close()
+            self._discard()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._cond:
+            while self._idle:
+                self._idle.pop()[0].close()
+                self._size -= 1
+
+    @contextmanager
+    def locked(self):
+        """Context generator for `with` statement, yields connection checked out for the current thread.
+
+        :return: pooled connection
+        :rtype: pydbal.connection.Connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._local.conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def query(self, sql, *args, **kwargs):
+        """Executes an SQL SELECT query and returns rows generator.
+
+        :param sql: query to execute
+        :param args: parameters iterable
+        :param kwargs: parameters iterable
+        :return: rows generator
+        :rtype: generator
+        """
+        with self.locked() as conn:
+            for row in conn.query(sql, *args, **kwargs):
+                yield row
+
+    def execute(self, sql, *args, **kwargs):
+        """Executes an SQL INSERT/UPDATE/DELETE query with the given parameters and returns the number of affected rows.
+
+        :param sql: statement to execute
+        :param args: parameters iterable
+        :param kwargs: parameters iterable
+        :return: number of affected rows
+        :rtype: int
+        """
+        with self.locked() as conn:
+            return conn.execute(sql, *args, **kwargs)
+
+    def fetch(self, sql, *args, **kwargs):
+        """Executes an SQL SELECT query and returns the first row or `None`.
+
+        :param sql: statement to execute
+        :param args: parameters iterable
+        :param kwargs: parameters iterable
+        :return: the first row or `None`
+        """
+        with self.locked() as conn:
+            return conn.query(sql, *args, **kwargs).fetch()
+
+    def fetch_all(self, sql, *args, **kwargs):
+        """Executes an SQL SELECT query and returns all selected rows.
+
+        :param sql: statement to execute
+        :param args: parameters iterable
+        :param kwargs: parameters iterable
+        :return: all selected rows
+        :rtype: list
+        """
+        with self.locked() as conn:
+            return conn.query(sql, *args, **kwargs).fetch_all()
+
+    def fetch_column(self, sql, *args, **kwargs):
+        """Executes an SQL SELECT query and returns the first column of the first row or `None`.
+
+        :param sql: statement to execute
+        :param args: parameters iterable
+        :param kwargs: parameters iterable
+        :return: the first row of the first column or `None`
+        """
+        with self.locked() as conn:
+            return conn.query(sql, *args, **kwargs).fetch_column()
+
+    def transaction(self, callback):
+        """Executes a function in a transaction on a pooled connection.
+
+        :param callback: the function to execute in a transaction
+        :return: the value returned by the `callback`
+        """
+        with self.locked() as conn:
+            return conn.transaction(callback)
+
+    def insert(self, table, values):
+        """Inserts a table row with specified data.
+
+        :param table: the expression of the table to insert data into, quoted or unquoted
+        :param values: a dictionary containing column-value pairs
+        :return: last inserted ID
+        """
+        with self.locked() as conn:
+            return conn.insert(table, values)
+
+    def update(self, table, values, identifier):
+        """Updates a table row with specified data by given identifier.
+
+        :param table: the expression of the table to update quoted or unquoted
+        :param values: a dictionary containing column-value pairs
+        :param identifier: the update criteria; a dictionary containing column-value pairs
+        :return: the number of affected rows
+        :rtype: int
+        """
+        with self.locked() as conn:
+            return conn.update(table, values, identifier)
+
+    def delete(self, table, identifier):
+        """Deletes a table row by given identifier.
+
+        :param table: the expression of the table to update quoted or unquoted
+        :param identifier: the delete criteria; a dictionary containing column-value pairs
+        :return: the number of affected rows
+        :rtype: int
+        """
+        with self.locked() as conn:
+            return conn.delete(table, identifier)
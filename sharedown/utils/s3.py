@@ -22,51 +22,287 @@
 
 from __future__ import absolute_import, division, print_function, with_statement
 
+import io
+import os
+import time
 import boto3
+import logging
+import threading
 
 from botocore.config import Config
-from boto3.s3.transfer import S3Transfer
-from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import S3Transfer, TransferConfig
 
+from . import chunks, content_disposition
+from .storage import Storage
+from .cache import LRUCache
 
-class S3:
+
+class S3(Storage):
+    SUPPORTS_DIRECT = True
     SIGNATURE_VERSION = "s3v4"
-    DEFAULT_CONTENT_TYPE = "binary/octet-stream"
-    VALID_CONTENT_TYPES = (
-        "application/vnd.android.package-archive",
-        DEFAULT_CONTENT_TYPE
-    )
-
-    def __init__(self, region, bucket, download_url_lifetime, storage_lifetime, **kwargs):
-        self._config = Config(signature_version=S3.SIGNATURE_VERSION)
-        self._client = boto3.client("s3", region, config=self._config)
+
+    def __init__(self, region, bucket, download_url_lifetime, storage_lifetime, download_url_margin=10,
+                 download_url_cache_size=1024, endpoint_url=None, max_pool_connections=10,
+                 multipart_threshold=8388608, multipart_chunksize=8388608, max_concurrency=10, **kwargs):
+        """Initialises S3 storage.
+
+        Transfers share one manager, so `max_concurrency` threads are shared by all concurrent uploads, while
+        `max_pool_connections` should cover them together with requests made directly from other threads.
+        """
+        Storage.__init__(self, storage_lifetime)
+        self._config = Config(signature_version=S3.SIGNATURE_VERSION, max_pool_connections=max_pool_connections)
+        # `endpoint_url` points the client to an S3 compatible service instead of AWS
+        self._client = boto3.client("s3", region, endpoint_url=endpoint_url, config=self._config)
+        self._transfer = S3Transfer(self._client, TransferConfig(
+            multipart_threshold=multipart_threshold, multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency))
         self._download_url_lifetime = download_url_lifetime
-        self._storage_lifetime = storage_lifetime
         self._bucket = bucket
 
-    @staticmethod
-    def _validate_content_type(content_type):
-        return content_type if content_type in S3.VALID_CONTENT_TYPES else S3.DEFAULT_CONTENT_TYPE
+        # signed URLs are reused until `download_url_margin` seconds before they expire
+        download_url_ttl = download_url_lifetime - download_url_margin
+        self._download_urls = LRUCache(download_url_cache_size, download_url_ttl) if download_url_ttl > 0 else None
 
-    def get_expiry_date(self):
-        return datetime.now() + timedelta(seconds=self._storage_lifetime)
-
-    def upload_file(self, filename, key, content_type=DEFAULT_CONTENT_TYPE, metadata=None):
-        S3Transfer(self._client).upload_file(filename, self._bucket, key, extra_args={
+    def upload_file(self, filename, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None):
+        started = time.time()
+        self._transfer.upload_file(filename, self._bucket, key, extra_args={
             "ContentType": S3._validate_content_type(content_type),
-            "Metadata": metadata
+            "Metadata": metadata or {}
         })
+        self._record_transfer(key, os.path.getsize(filename), started)
 
-    def download_url(self, key):
-        return self._client.generate_presigned_url("get_object", {
-            "Bucket": self._bucket,
-            "Key": key
-        }, self._download_url_lifetime)
+    def put_object(self, data, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None, cache_control=None):
+        started = time.time()
+        extra = {"CacheControl": cache_control} if cache_control else {}
+        self._client.put_object(
+            Bucket=self._bucket, Key=key, Body=data, ContentType=S3._validate_content_type(content_type),
+            Metadata=metadata or {}, **extra)
+        self._record_transfer(key, len(data), started)
+
+    def get_object(self, key):
+        """Fetches a small object into memory.
+
+        :return: object contents or None if object does not exist
+        :rtype: str
+        """
+        try:
+            return self._client.get_object(Bucket=self._bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+        return None
+
+    def create_multipart_upload(self, key, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None):
+        """Starts a multipart upload, parts may then be uploaded concurrently.
+
+        :rtype: MultipartUpload
+        """
+        response = self._client.create_multipart_upload(
+            Bucket=self._bucket, Key=key, ContentType=S3._validate_content_type(content_type),
+            Metadata=metadata or {})
+        return MultipartUpload(self._client, self._bucket, key, response["UploadId"], self._record_transfer)
+
+    def get_multipart_upload(self, key, upload_id):
+        """Resumes a multipart upload started earlier, possibly by another process.
+
+        :rtype: MultipartUpload
+        """
+        return MultipartUpload(self._client, self._bucket, key, upload_id)
+
+    def presigned_post(self, key, size, lifetime, content_type=Storage.DEFAULT_CONTENT_TYPE, metadata=None):
+        """Generates a policy for uploading an object directly from a browser with a single POST request.
+
+        :param key: object key
+        :param size: exact size of the object
+        :param lifetime: number of seconds the policy is valid for
+        :return: form `url` and `fields`
+        :rtype: dict
+        """
+        fields = {"Content-Type": S3._validate_content_type(content_type)}
+        for name, value in (metadata or {}).iteritems():
+            fields["x-amz-meta-" + name] = value
+
+        conditions = [{name: value} for name, value in fields.iteritems()]
+        conditions.append(["content-length-range", size, size])
+        return self._client.generate_presigned_post(self._bucket, key, fields, conditions, lifetime)
+
+    def stat(self, key):
+        try:
+            head = self._client.head_object(Bucket=self._bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+            return None
+        return {"size": head["ContentLength"], "modified": head["LastModified"]}
+
+    def open(self, key, size=None, buffer_size=262144):
+        """Opens an object for reading as a seekable file, data is fetched with ranged requests.
+
+        :param key: object key
+        :param size: object size, fetched if not given
+        :param buffer_size: minimal size of a single request
+        :rtype: io.BufferedReader
+        """
+        if size is None:
+            size = self._client.head_object(Bucket=self._bucket, Key=key)["ContentLength"]
+        return io.BufferedReader(S3File(self._client, self._bucket, key, size), buffer_size)
+
+    def download_url(self, key, filename=None):
+        """Generates a signed URL for downloading an object.
+
+        :param key: object key
+        :param filename: name to save the object with, if it differs from the last part of the key
+        :rtype: str
+        """
+        if filename is not None and key.rsplit("/", 1)[-1] == filename:
+            filename = None
+
+        # URLs are cached per object, so that a deleted object drops URLs for all names it is downloaded with
+        urls = None
+        if self._download_urls is not None:
+            urls = self._download_urls.get(key)
+            if urls is None:
+                urls = {}
+                self._download_urls.set(key, urls)
+            elif filename in urls:
+                return urls[filename]
+
+        params = {"Bucket": self._bucket, "Key": key}
+        if filename is not None:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        url = self._client.generate_presigned_url("get_object", params, self._download_url_lifetime)
+
+        if urls is not None:
+            # URLs generated later expire later, so they are safe to keep for the rest of the entry lifetime
+            urls[filename] = url
+        return url
+
+    def _invalidate(self, keys):
+        if self._download_urls is not None:
+            for key in keys:
+                self._download_urls.pop(key)
 
     def delete(self, key):
+        self._invalidate((key, ))
         return self._client.delete_object(Bucket=self._bucket, Key=key)
 
     def delete_many(self, keys):
-        return self._client.delete_objects(Bucket=self._bucket, Delete={
-            "Objects": map(lambda x: {"Key": x}, keys)
-        })
+        """Deletes objects in chunks of up to `DELETE_MANY_LIMIT` keys per request.
+
+        :param keys: object keys
+        :return: keys confirmed as deleted
+        :rtype: list
+        """
+        deleted = []
+        for chunk in chunks(keys, S3.DELETE_MANY_LIMIT):
+            response = self._client.delete_objects(Bucket=self._bucket, Delete={
+                "Objects": map(lambda x: {"Key": x}, chunk)
+            })
+            deleted.extend(x["Key"] for x in response.get("Deleted", ()))
+            self._invalidate(chunk)
+            for error in response.get("Errors", ()):
+                logging.error("Failed to delete %s: %s", error["Key"], error.get("Message"))
+        return deleted
+
+
+class MultipartUpload:
+    def __init__(self, client, bucket, key, upload_id, on_complete=None):
+        """Initialises multipart upload.
+
+        :param on_complete: callback receiving key, number of uploaded bytes and start time, called on completion
+        """
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self.upload_id = upload_id
+        self._on_complete = on_complete
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def upload_part(self, number, data):
+        response = self._client.upload_part(
+            Bucket=self._bucket, Key=self._key, UploadId=self.upload_id, PartNumber=number, Body=data)
+        with self._lock:
+            self._size += len(data)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def complete(self, parts):
+        self._client.complete_multipart_upload(
+            Bucket=self._bucket, Key=self._key, UploadId=self.upload_id, MultipartUpload={
+                "Parts": sorted(parts, key=lambda x: x["PartNumber"])
+            })
+        if self._on_complete is not None:
+            self._on_complete(self._key, self._size, self._started)
+
+    def part_url(self, number, lifetime):
+        """Generates a URL for uploading a part directly from a browser with PUT request."""
+        return self._client.generate_presigned_url("upload_part", {
+            "Bucket": self._bucket,
+            "Key": self._key,
+            "UploadId": self.upload_id,
+            "PartNumber": number
+        }, lifetime, "PUT")
+
+    def list_parts(self):
+        """Lists parts received by S3.
+
+        :return: parts with `PartNumber`, `ETag` and `Size`
+        :rtype: list
+        """
+        parts, marker = [], 0
+        while True:
+            response = self._client.list_parts(
+                Bucket=self._bucket, Key=self._key, UploadId=self.upload_id, PartNumberMarker=marker)
+            parts.extend(response.get("Parts", ()))
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
+
+    def abort(self):
+        try:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self.upload_id)
+        except ClientError as e:
+            # already completed or aborted
+            if e.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+
+
+class S3File(io.RawIOBase):
+    def __init__(self, client, bucket, key, size):
+        super(S3File, self).__init__()
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise IOError("Invalid seek position: %d" % offset)
+        self._position = offset
+        return offset
+
+    def readinto(self, b):
+        if self._position >= self._size or not len(b):
+            return 0
+        end = min(self._position + len(b), self._size) - 1
+        data = self._client.get_object(
+            Bucket=self._bucket, Key=self._key, Range="bytes=%d-%d" % (self._position, end))["Body"].read()
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+import heapq
+
+from tornado.ioloop import IOLoop
+
+
+class ExpiryScheduler:
+    DELAY = 1
+
+    def __init__(self, callback, horizon):
+        """Initialises min-heap of upcoming file expiry times. Must be used on the IOLoop thread only.
+
+        :param callback: function called with a list of keys when their expiry time is due
+        :param horizon: seconds ahead to keep in the heap; later expiries are left to the periodic scan
+        """
+        self._callback = callback
+        self._horizon = horizon
+        self._heap = []
+        self._entries = {}
+        self._timeout = None
+        self._deadline = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, expires_at):
+        """Schedules (or reschedules) file expiry.
+
+        :param key: file key
+        :param expires_at: expiry date or `None` for permanent files
+        """
+        if expires_at is None:
+            return self.unschedule(key)
+
+        deadline = time.mktime(expires_at.timetuple())
+        if deadline > time.time() + self._horizon:
+            return self.unschedule(key)
+        if self._entries.get(key) == deadline:
+            return
+
+        self._entries[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        self._reset()
+
+    def unschedule(self, key):
+        # heap entry is skipped lazily when it reaches the top
+        self._entries.pop(key, None)
+
+    def load(self, files):
+        for file_ in files:
+            self.schedule(file_["key"], file_["expires_at"])
+
+    def _reset(self):
+        while self._heap and self._entries.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+        deadline = self._heap[0][0] if self._heap else None
+        if deadline == self._deadline:
+            return
+
+        io_loop = IOLoop.current()
+        if self._timeout is not None:
+            io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+        self._deadline = deadline
+        if deadline is not None:
+            # give the database clock a moment to agree that the file is expired
+            delay = max(0, deadline - time.time()) + ExpiryScheduler.DELAY
+            self._timeout = io_loop.call_later(delay, self._run)
+
+    def _run(self):
+        self._timeout = None
+        self._deadline = None
+
+        keys = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, key = heapq.heappop(self._heap)
+            if self._entries.get(key) == deadline:
+                del self._entries[key]
+                keys.append(key)
+
+        if keys:
+            self._callback(keys)
+        self._reset()
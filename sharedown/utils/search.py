@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import re
+
+# InnoDB full-text index ignores shorter tokens (innodb_ft_min_token_size)
+MIN_TOKEN_SIZE = 3
+
+_RE_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text):
+    return _RE_TOKEN.findall(text or "")
+
+
+def match_query(search, prefix=True):
+    """Builds boolean mode full-text query requiring all search tokens.
+
+    :param search: search string
+    :param prefix: match tokens as prefixes
+    :return: query for `MATCH ... AGAINST` or `None` if the search has no indexable tokens
+    """
+    tokens = [x for x in tokenize(search) if len(x) >= MIN_TOKEN_SIZE]
+    if not tokens:
+        return None
+    return " ".join("+%s%s" % (x, "*" if prefix else "") for x in tokens)
+
+
+def _document(row):
+    # file name is also split into tokens, so "MyApp_v1.2.ipa" is found by "myapp"
+    parts = (row["name"], " ".join(tokenize(row["name"])), row["caption"], row["folder"], row["meta"])
+    return " ".join(x for x in parts if x)
+
+
+def reindex(db, keys):
+    """Rebuilds search documents from file name, caption, folder and metadata values.
+
+    :param db: database connection or pool
+    :param keys: file keys
+    """
+    if not keys:
+        return
+
+    # `query` is the only fetch method shared by pydbal connections and the pool
+    rows = list(db.query(
+        "SELECT f.key, f.name, f.caption, f.folder, GROUP_CONCAT(m.value SEPARATOR ' ') meta FROM files f "
+        "LEFT JOIN meta m ON m.key = f.key WHERE f.key IN (?) GROUP BY f.key", list(keys)))
+    if rows:
+        db.execute("INSERT INTO search (`key`, content) VALUES " + ", ".join(("(?)", ) * len(rows)) +
+                   " ON DUPLICATE KEY UPDATE content = VALUES(content)",
+                   *[(row["key"], _document(row)) for row in rows])
+
+
+def rebuild(db, batch_size=1000):
+    """Rebuilds search documents of all files.
+
+    :param db: database connection or pool
+    :param batch_size: number of files indexed per statement
+    """
+    after = ""
+    while True:
+        keys = db.fetch_all(
+            "SELECT `key` FROM files WHERE `key` > ? ORDER BY `key` LIMIT %d" % batch_size, after)
+        if not keys:
+            break
+        keys = [x["key"] for x in keys]
+        reindex(db, keys)
+        after = keys[-1]
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import logging
+
+from threading import Lock
+from datetime import datetime
+from collections import deque, Counter
+
+STATUS_OK = "OK"
+
+
+def rebuild_counters(db):
+    """Recalculates materialized download counters of all files from statistics.
+
+    :param db: database connection or pool
+    :return: number of affected rows
+    :rtype: int
+    """
+    return db.execute(
+        "UPDATE files f LEFT JOIN (SELECT `key`, COUNT(*) downloads FROM stats WHERE status = ? "
+        "AND deleted_at IS NULL GROUP BY `key`) s ON s.key = f.key SET f.downloads = COALESCE(s.downloads, 0)",
+        STATUS_OK)
+
+
+def _write(conn, rows):
+    conn.execute("INSERT INTO stats (`key`, name, status, ip, created_at) VALUES " +
+                 ", ".join(("(?)", ) * len(rows)), *rows)
+
+    # increment materialized download counters in the same transaction
+    counters = Counter(row[0] for row in rows if row[2] == STATUS_OK)
+    if counters:
+        params = [x for item in counters.iteritems() for x in item]
+        conn.execute("UPDATE files SET downloads = downloads + CASE `key` " +
+                     " ".join(("WHEN ? THEN ?", ) * len(counters)) + " END WHERE `key` IN (?)",
+                     *(params + [counters.keys()]))
+
+
+class StatsBuffer:
+    def __init__(self, max_size=10000, flush_size=500):
+        """Initialises write-behind buffer for download statistics.
+
+        When the buffer is full the oldest rows are dropped.
+
+        :param max_size: maximum number of buffered rows
+        :param flush_size: number of rows written by a single INSERT
+        """
+        assert 0 < flush_size <= max_size
+
+        self._rows = deque()
+        self._max_size = max_size
+        self._flush_size = flush_size
+        self._dropped = 0
+        self._reported = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def append(self, key, name, status, ip):
+        """Buffers a statistics row.
+
+        :return: `True` if the buffer has just reached the flush size
+        :rtype: bool
+        """
+        row = (key, name, status, ip, datetime.now())
+        with self._lock:
+            if len(self._rows) >= self._max_size:
+                self._rows.popleft()
+                self._dropped += 1
+            self._rows.append(row)
+            return len(self._rows) == self._flush_size
+
+    def _requeue(self, rows):
+        with self._lock:
+            for row in reversed(rows):
+                if len(self._rows) >= self._max_size:
+                    self._dropped += 1
+                    continue
+                self._rows.appendleft(row)
+
+    def flush(self, db):
+        """Writes all buffered rows with multi-row INSERTs.
+
+        :param db: database connection or pool
+        :return: number of written rows
+        :rtype: int
+        """
+        written = 0
+        while True:
+            with self._lock:
+                rows = [self._rows.popleft() for _ in range(min(self._flush_size, len(self._rows)))]
+                dropped, self._reported = self._dropped - self._reported, self._dropped
+            if dropped:
+                logging.warning("Stats buffer is full: %d rows dropped", dropped)
+            if not rows:
+                return written
+
+            try:
+                db.transaction(lambda conn: _write(conn, rows))
+            except Exception as e:
+                self._requeue(rows)
+                logging.error(e)
+                return written
+            written += len(rows)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+import logging
+import threading
+
+from datetime import datetime, timedelta
+
+
+class Storage:
+    """Base of storage backends keeping file contents as objects addressed by string keys ("<key>/<name>").
+
+    Backends without `SUPPORTS_DIRECT` can not receive uploads from clients directly, so presigned POST policies and
+    part URLs are not available and data is always passed through the application.
+    """
+
+    SUPPORTS_DIRECT = False
+    DELETE_MANY_LIMIT = 1000
+    DEFAULT_CONTENT_TYPE = "binary/octet-stream"
+    VALID_CONTENT_TYPES = (
+        "application/vnd.android.package-archive",
+        "image/png",
+        DEFAULT_CONTENT_TYPE
+    )
+    ICON_SIZES = (48, 96)
+    ICON_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+    def __init__(self, storage_lifetime):
+        """Initialises storage.
+
+        :param storage_lifetime: number of seconds files are kept by default
+        """
+        self._storage_lifetime = storage_lifetime
+        self._stats_lock = threading.Lock()
+        self._stats = {"transfers": 0, "bytes": 0, "seconds": 0.0}
+
+    @staticmethod
+    def _validate_content_type(content_type):
+        return content_type if content_type in Storage.VALID_CONTENT_TYPES else Storage.DEFAULT_CONTENT_TYPE
+
+    @staticmethod
+    def object_key(file_):
+        """Returns key of the object with file content, which is the shared blob for deduplicated files.
+
+        :param file_: file row with `key`, `name` and optionally blob `object`
+        :rtype: str
+        """
+        return file_.get("object") or "%s/%s" % (file_["key"], file_["name"])
+
+    @staticmethod
+    def icon_key(key, size):
+        # file names can not contain slashes, so icons never clash with the file itself
+        return "%s/@icon/%d.png" % (key, size)
+
+    @staticmethod
+    def icon_keys(key):
+        return [Storage.icon_key(key, size) for size in Storage.ICON_SIZES]
+
+    def get_expiry_date(self):
+        return datetime.now() + timedelta(seconds=self._storage_lifetime)
+
+    def _record_transfer(self, key, size, started):
+        seconds = max(time.time() - started, 1e-6)
+        with self._stats_lock:
+            self._stats["transfers"] += 1
+            self._stats["bytes"] += size
+            self._stats["seconds"] += seconds
+        logging.info("Uploaded %s: %d bytes in %.2fs (%.2f MB/s)", key, size, seconds, size / seconds / 1048576)
+
+    def get_stats(self):
+        """Returns totals of uploads completed by this process.
+
+        :return: number of `transfers`, `bytes`, `seconds` spent and average `throughput` in bytes per second
+        :rtype: dict
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["throughput"] = stats["bytes"] / stats["seconds"] if stats["seconds"] else 0
+        return stats
+
+    def upload_file(self, filename, key, content_type=DEFAULT_CONTENT_TYPE, metadata=None):
+        """Stores a local file.
+
+        :param filename: path to the file
+        :param key: object key
+        :param content_type: content type of the object
+        :param metadata: dict of user metadata
+        """
+        raise NotImplementedError
+
+    def put_object(self, data, key, content_type=DEFAULT_CONTENT_TYPE, metadata=None, cache_control=None):
+        """Stores an object from memory."""
+        raise NotImplementedError
+
+    def get_object(self, key):
+        """Fetches a small object into memory.
+
+        :return: object contents or None if object does not exist
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Fetches object details.
+
+        :return: object `size` and `modified` date, or None if object does not exist
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def open(self, key, size=None, buffer_size=262144):
+        """Opens an object for reading as a seekable file.
+
+        :param key: object key
+        :param size: object size, fetched if not given
+        :param buffer_size: minimal size of a single read from the storage
+        :rtype: io.BufferedReader
+        """
+        raise NotImplementedError
+
+    def download_url(self, key, filename=None):
+        """Generates a short-lived URL for downloading an object.
+
+        :param key: object key
+        :param filename: name to save the object with, if it differs from the last part of the key
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """Deletes objects in chunks of up to `DELETE_MANY_LIMIT` keys.
+
+        :param keys: object keys
+        :return: keys confirmed as deleted
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def create_multipart_upload(self, key, content_type=DEFAULT_CONTENT_TYPE, metadata=None):
+        """Starts a multipart upload, parts may then be uploaded concurrently.
+
+        The upload provides `upload_id`, `upload_part(number, data)`, `complete(parts)`, `list_parts()` and `abort()`.
+        """
+        raise NotImplementedError
+
+    def get_multipart_upload(self, key, upload_id):
+        """Resumes a multipart upload started earlier, possibly by another process."""
+        raise NotImplementedError
+
+    def presigned_post(self, key, size, lifetime, content_type=DEFAULT_CONTENT_TYPE, metadata=None):
+        """Generates a policy for uploading an object directly from a browser, if `SUPPORTS_DIRECT` is set."""
+        raise NotImplementedError
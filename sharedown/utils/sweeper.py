@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import logging
+
+from . import chunks
+from .storage import Storage
+from .blobs import BlobStore
+
+
+class Sweeper:
+    COLUMNS = "f.`key`, f.login, f.name, f.has_icon, f.sha256, b.object"
+
+    def __init__(self, db, storage, batch_size=1000):
+        """Initialises batched remover of files from storage and database.
+
+        :param db: database connection pool
+        :param storage: file storage
+        :param batch_size: number of expired files fetched per batch
+        """
+        self._db = db
+        self._storage = storage
+        self._batch_size = batch_size
+
+    @staticmethod
+    def _object_key(file_):
+        return Storage.object_key(file_)
+
+    @staticmethod
+    def _owned_object_key(file_):
+        # a file referring to a blob stored by another file may still have its own object, if it failed to be dropped
+        object_key = "%s/%s" % (file_["key"], file_["name"])
+        if file_["sha256"] and object_key == file_["object"]:
+            return None
+        return object_key
+
+    @staticmethod
+    def object_keys(files):
+        """Returns keys of objects owned by the files, i.e. icon thumbnails and objects not shared as blobs.
+
+        :param files: file rows with `key`, `name`, `has_icon`, `sha256` and blob `object`
+        :rtype: list
+        """
+        keys = []
+        for file_ in files:
+            object_key = Sweeper._owned_object_key(file_)
+            if object_key is not None:
+                keys.append(object_key)
+            if file_["has_icon"]:
+                keys.extend(Storage.icon_keys(file_["key"]))
+        return keys
+
+    def fetch_expired(self, after="", keys=None):
+        """Fetches the next batch of expired files ordered by key.
+
+        :param after: key of the last file of the previous batch
+        :param keys: restrict to given keys
+        :return: expired files
+        :rtype: list
+        """
+        sql, params = (
+            "SELECT %s FROM files f LEFT JOIN blobs b ON b.sha256 = f.sha256 WHERE f.expires_at < NOW() "
+            "AND f.`key` > ?" % Sweeper.COLUMNS, [after])
+        if keys is not None:
+            sql += " AND f.`key` IN (?)"
+            params.append(keys)
+        return self._db.fetch_all(sql + " ORDER BY f.`key` LIMIT %d" % self._batch_size, *params)
+
+    def fetch_upcoming(self, horizon):
+        """Fetches files which expire within given number of seconds.
+
+        :param horizon: number of seconds
+        :return: files with `key` and `expires_at`
+        :rtype: list
+        """
+        return self._db.fetch_all(
+            "SELECT `key`, expires_at FROM files WHERE expires_at >= NOW() "
+            "AND expires_at < NOW() + INTERVAL %d SECOND" % horizon)
+
+    def fetch(self, keys, login=None):
+        """Fetches files for deletion.
+
+        :param keys: file keys
+        :param login: restrict to files of the user
+        :return: files with the columns `delete` needs
+        :rtype: list
+        """
+        sql, params = "SELECT %s FROM files f LEFT JOIN blobs b ON b.sha256 = f.sha256 WHERE f.`key` IN (?)" % (
+            Sweeper.COLUMNS), [keys]
+        if login is not None:
+            sql += " AND f.login = ?"
+            params.append(login)
+        return self._db.fetch_all(sql, *params)
+
+    def delete(self, files):
+        """Deletes files from storage in chunks and removes database rows of confirmed objects only.
+
+        Files sharing a blob are removed from database first, the blob is deleted from storage with its last reference.
+
+        :param files: file rows with `key`, `name`, `has_icon`, `sha256` and blob `object`
+        :return: deleted file rows
+        :rtype: list
+        """
+        deleted = []
+        for chunk in chunks(files, Storage.DELETE_MANY_LIMIT):
+            keys = Sweeper.object_keys(chunk)
+            # files without an object of their own only drop the reference to their blob
+            confirmed = {None}
+            if keys:
+                confirmed.update(self._storage.delete_many(keys))
+            rows = [file_ for file_ in chunk if Sweeper._owned_object_key(file_) in confirmed]
+            if not rows:
+                continue
+
+            def callback(conn):
+                # references are taken from locked rows, a blob may have been attached since the files were fetched
+                keys = [file_["key"] for file_ in rows]
+                current = conn.query("SELECT sha256 FROM files WHERE `key` IN (?) FOR UPDATE", keys).fetch_all()
+                conn.execute("DELETE FROM files WHERE `key` IN (?)", keys)
+                return BlobStore.release(conn, current)
+
+            objects = self._db.transaction(callback)
+            if objects:
+                self._storage.delete_many(objects)
+            deleted.extend(rows)
+        return deleted
+
+    def fetch_abandoned(self, lifetime, after=""):
+        """Fetches the next batch of resumable uploads without activity for given number of seconds.
+
+        :param lifetime: number of seconds
+        :param after: key of the last upload of the previous batch
+        :return: uploads with `key`, `name` and `upload_id`
+        :rtype: list
+        """
+        return self._db.fetch_all(
+            "SELECT `key`, name, upload_id FROM uploads WHERE updated_at < NOW() - INTERVAL %d SECOND "
+            "AND `key` > ? ORDER BY `key` LIMIT %d" % (lifetime, self._batch_size), after)
+
+    def abort_uploads(self, uploads):
+        """Aborts multipart uploads in storage and removes database rows of aborted ones.
+
+        :param uploads: upload rows with `key`, `name` and `upload_id`
+        :return: keys of aborted uploads
+        :rtype: list
+        """
+        aborted = []
+        for upload in uploads:
+            try:
+                if upload["upload_id"] is not None:
+                    self._storage.get_multipart_upload(Sweeper._object_key(upload), upload["upload_id"]).abort()
+                else:
+                    # the object may have been posted directly to S3 without completing the upload
+                    self._storage.delete(Sweeper._object_key(upload))
+            except Exception as e:
+                logging.error("Failed to abort upload %s: %s", upload["key"], e)
+                continue
+            aborted.append(upload["key"])
+        if aborted:
+            self._db.execute("DELETE FROM uploads WHERE `key` IN (?)", aborted)
+        return aborted
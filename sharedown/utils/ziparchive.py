@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2016 Alexander Lokhman <alex.lokhman@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from __future__ import absolute_import, division, print_function, with_statement
+
+import io
+import os
+import mmap
+import zlib
+import struct
+
+_EOCD = struct.Struct("<4s4H2LH")
+_EOCD_SIGNATURE = b"PK\x05\x06"
+_EOCD64_LOCATOR = struct.Struct("<4sLQL")
+_EOCD64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+_EOCD64 = struct.Struct("<4sQ2H2L4Q")
+_EOCD64_SIGNATURE = b"PK\x06\x06"
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+_MAX_COMMENT_SIZE = 0xFFFF
+_ZIP64_EXTRA = 0x0001
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+
+class ZipError(IOError):
+    pass
+
+
+class ZipEntry:
+    def __init__(self, name, method, crc, compressed_size, size, offset):
+        self.name = name
+        self.method = method
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.offset = offset
+
+
+class ZipArchive:
+    def __init__(self, source):
+        """Opens zip archive for random access to single entries.
+
+        Only the end of central directory record, the central directory and the entries which are read are accessed,
+        so opening an archive takes the same time regardless of its size. Zip64 archives are supported.
+
+        :param source: path to a file (memory-mapped) or seekable file object
+        """
+        self._file = self._mmap = None
+        if isinstance(source, basestring):
+            self._file = open(source, "rb")
+            self._size = os.fstat(self._file.fileno()).st_size
+            if self._size:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._source = source
+            self._source.seek(0, io.SEEK_END)
+            self._size = self._source.tell()
+
+        try:
+            self._offset, self._cd_offset, self._cd_size, self._count = self._find_central_directory()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read(self, offset, length):
+        if offset < 0 or offset + length > self._size:
+            raise ZipError("Read out of archive bounds")
+        if self._mmap is not None:
+            return self._mmap[offset:offset + length]
+        self._source.seek(offset)
+        data = self._source.read(length)
+        if len(data) != length:
+            raise ZipError("Unexpected end of archive")
+        return data
+
+    def _find_central_directory(self):
+        """Locates the central directory from the end of central directory record.
+
+        :return: offset of data prepended to the archive, central directory offset, size and number of entries
+        :rtype: tuple
+        """
+        tail_size = min(self._size, _EOCD.size + _MAX_COMMENT_SIZE)
+        tail = self._read(self._size - tail_size, tail_size)
+
+        position = tail.rfind(_EOCD_SIGNATURE)
+        while position >= 0 and position + _EOCD.size > len(tail):
+            position = tail.rfind(_EOCD_SIGNATURE, 0, position)
+        if position < 0:
+            raise ZipError("End of central directory not found")
+
+        eocd = self._size - tail_size + position
+        _, _, _, _, count, cd_size, cd_offset, _ = _EOCD.unpack_from(tail, position)
+        end = eocd
+
+        if count == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+            if eocd < _EOCD64_LOCATOR.size:
+                raise ZipError("Zip64 end of central directory locator not found")
+            signature, _, eocd64, _ = _EOCD64_LOCATOR.unpack(self._read(eocd - _EOCD64_LOCATOR.size,
+                                                                         _EOCD64_LOCATOR.size))
+            if signature != _EOCD64_LOCATOR_SIGNATURE:
+                raise ZipError("Zip64 end of central directory locator not found")
+
+            # the record position is relative to the archive start, which may be preceded by other data
+            end = eocd - _EOCD64_LOCATOR.size - _EOCD64.size
+            fields = _EOCD64.unpack(self._read(end, _EOCD64.size))
+            if fields[0] != _EOCD64_SIGNATURE:
+                raise ZipError("Zip64 end of central directory not found")
+            count, cd_size, cd_offset = fields[7], fields[8], fields[9]
+
+        offset = end - cd_size - cd_offset
+        if offset < 0:
+            raise ZipError("Invalid central directory")
+        return offset, offset + cd_offset, cd_size, count
+
+    def entries(self):
+        """Iterates over entries in the central directory.
+
+        :rtype: generator
+        """
+        data, position = self._read(self._cd_offset, self._cd_size), 0
+        for _ in range(self._count):
+            fields = _CENTRAL_HEADER.unpack_from(data, position)
+            if fields[0] != _CENTRAL_HEADER_SIGNATURE:
+                raise ZipError("Invalid central directory entry")
+
+            flags, method, crc, compressed_size, size = fields[3], fields[4], fields[7], fields[8], fields[9]
+            name_size, extra_size, comment_size, offset = fields[10], fields[11], fields[12], fields[16]
+
+            position += _CENTRAL_HEADER.size
+            name = data[position:position + name_size]
+            name = name.decode("utf8" if flags & 0x800 else "cp437")
+            extra = data[position + name_size:position + name_size + extra_size]
+            position += name_size + extra_size + comment_size
+
+            if 0xFFFFFFFF in (compressed_size, size, offset):
+                size, compressed_size, offset = self._parse_zip64_extra(extra, size, compressed_size, offset)
+
+            yield ZipEntry(name, method, crc, compressed_size, size, self._offset + offset)
+
+    @staticmethod
+    def _parse_zip64_extra(extra, size, compressed_size, offset):
+        position = 0
+        while position + 4 <= len(extra):
+            header, length = struct.unpack_from("<2H", extra, position)
+            position += 4
+            if header == _ZIP64_EXTRA:
+                # only the fields which do not fit into the central directory header are present, in this order
+                values = []
+                for value in (size, compressed_size, offset):
+                    if value == 0xFFFFFFFF:
+                        value = struct.unpack_from("<Q", extra, position)[0]
+                        position += 8
+                    values.append(value)
+                return values
+            position += length
+        raise ZipError("Zip64 extra field not found")
+
+    def find(self, predicate):
+        """Finds the first entry which name matches the predicate.
+
+        :param predicate: function called with entry name
+        :return: entry or None
+        :rtype: ZipEntry
+        """
+        for entry in self.entries():
+            if predicate(entry.name):
+                return entry
+        return None
+
+    def read(self, entry, max_size=None):
+        """Reads and decompresses the entry.
+
+        :param entry: central directory entry
+        :param max_size: maximum uncompressed size
+        :return: entry contents
+        :rtype: str
+        """
+        # deflate may grow incompressible data slightly (zlib `deflateBound`), the compressed data is read at once
+        if max_size is not None and (entry.size > max_size or
+                                     entry.compressed_size > max_size + (max_size >> 12) + (max_size >> 14) + 13):
+            raise ZipError("Entry %s is too large" % entry.name)
+
+        fields = _LOCAL_HEADER.unpack(self._read(entry.offset, _LOCAL_HEADER.size))
+        if fields[0] != _LOCAL_HEADER_SIGNATURE:
+            raise ZipError("Invalid local header of entry %s" % entry.name)
+        if fields[2] & 0x1:
+            raise ZipError("Entry %s is encrypted" % entry.name)
+
+        data = self._read(entry.offset + _LOCAL_HEADER.size + fields[9] + fields[10], entry.compressed_size)
+        if entry.method == METHOD_DEFLATED:
+            data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(data, entry.size + 1)
+        elif entry.method != METHOD_STORED:
+            raise ZipError("Unsupported compression method %d of entry %s" % (entry.method, entry.name))
+
+        if len(data) != entry.size or zlib.crc32(data) & 0xFFFFFFFF != entry.crc:
+            raise ZipError("Entry %s is corrupted" % entry.name)
+        return data